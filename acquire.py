@@ -0,0 +1,114 @@
+'''Headless acquisition daemon: polls the tags of a tag file and writes their values to a sink
+
+Doesn't import Qt, so it runs on edge boxes and in containers without PyQt5.
+
+Examples:
+    python acquire.py tags.json --format jsonl --output values.jsonl
+    python acquire.py tags.json --format historian --output history/
+    python acquire.py tags.json --processes 4 --format csv --output values.csv
+'''
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+from util.engine import AcquisitionEngine
+from util.metrics import Metrics
+from util.sinks import SINKS
+from util.tagfile import load_tags
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Poll PLC tags without the GUI")
+    parser.add_argument("tag_file", help="tag list as .json, .csv or a tag database (.db, as saved by the GUI)")
+    parser.add_argument("--ip", default="192.168.0.1", help="PLC address for tags without an ip_address")
+    parser.add_argument("--rack", type=int, default=0)
+    parser.add_argument("--slot", type=int, default=1)
+    parser.add_argument("--period", type=float, default=0.1, help="scan period in seconds of the normal scan class")
+    parser.add_argument("--format", choices=sorted(SINKS) + ["historian"], default="stdout")
+    parser.add_argument("--output", help="file to write to instead of stdout; the directory to record to for historian")
+    parser.add_argument("--all", action="store_true", help="write every value of every scan, not just changes")
+    parser.add_argument("--metrics", help="time the scans and write a JSON snapshot of the statistics to this file")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="spread the PLCs over this many worker processes; 0 polls from this process")
+    args = parser.parse_args(argv)
+    if args.processes and args.metrics:
+        parser.error("--metrics times the scans of this process and can't be combined with --processes")
+    return args
+
+
+async def write_metrics(metrics, path):
+    '''Rewrites the metrics snapshot file once per metrics window'''
+    while True:
+        await asyncio.sleep(metrics.window)
+        save_metrics(metrics, path)
+
+
+def save_metrics(metrics, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(metrics.to_json())
+
+
+async def acquire(engine, sink, names, metrics_path=None):
+    '''Runs the engine and writes every result to the sink until the engine is stopped'''
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, engine.stop)
+        except (NotImplementedError, RuntimeError):
+            # No signal handlers on Windows; Ctrl+C still ends the loop with KeyboardInterrupt
+            pass
+
+    polling = asyncio.create_task(engine.run())
+    snapshots = asyncio.create_task(write_metrics(engine.metrics, metrics_path)) if metrics_path else None
+    while not polling.done():
+        get = asyncio.create_task(engine.results.get())
+        await asyncio.wait({get, polling}, return_when=asyncio.FIRST_COMPLETED)
+        if get.done():
+            sink.write(get.result(), names)
+        else:
+            get.cancel()
+    await polling
+    if snapshots is not None:
+        snapshots.cancel()
+        save_metrics(engine.metrics, metrics_path)
+
+    while not engine.results.empty():
+        sink.write(engine.results.get_nowait(), names)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Diagnostics go to stderr, so the values written to stdout stay machine-readable
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    tags = load_tags(args.tag_file)
+    names = [tag.get("name", "") for tag in tags]
+
+    # Sharding and the historian need NumPy, so they are only imported when asked for
+    if args.processes:
+        from util.sharding import ShardedEngine
+        engine = ShardedEngine(args.processes, change_only=not args.all)
+    else:
+        engine = AcquisitionEngine(change_only=not args.all, metrics=Metrics() if args.metrics else None)
+    engine.add_tags(tags, args.rack, args.slot, scan_period=args.period, default_ip_address=args.ip)
+
+    if args.format == "historian":
+        from util.historian import HistorianSink
+        stream = None
+        sink = HistorianSink(args.output or "history")
+    else:
+        stream = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+        sink = SINKS[args.format](stream)
+    try:
+        asyncio.run(acquire(engine, sink, names, args.metrics))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        if stream is not None and stream is not sys.stdout:
+            stream.close()
+
+
+if __name__ == "__main__":
+    main()
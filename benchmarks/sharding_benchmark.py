@@ -0,0 +1,89 @@
+'''Values per second delivered by one acquisition process versus several
+
+Polls many endpoints with every value reported on every scan, so decoding,
+not the network, is the bottleneck; then runs the same load through
+ShardedEngine with more and more worker processes. The endpoints are all the
+simulator, told apart by their rack number, so each gets its own connection.
+Scaling needs as many free cores as processes.
+
+Run from the repository root, e.g.:
+    python benchmarks/sharding_benchmark.py --plcs 8 --tags 2000 --processes 1 2 4
+'''
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.engine import AcquisitionEngine
+from util.sharding import ShardedEngine
+from util.simulator import PlcSimulator
+from throughput_benchmark import make_tags
+
+
+async def measure(engine, seconds, warmup):
+    '''Runs the engine and returns the values delivered per second after the warmup'''
+    polling = asyncio.create_task(engine.run())
+    counting_from = time.perf_counter() + warmup
+    counted = 0
+    while time.perf_counter() < counting_from + seconds:
+        try:
+            result = await asyncio.wait_for(engine.results.get(), 0.1)
+        except asyncio.TimeoutError:
+            continue
+        if time.perf_counter() >= counting_from:
+            counted += len(result.values)
+    engine.stop()
+    await polling
+    return counted / seconds
+
+
+def add_plcs(engine, port, plcs, tags, period):
+    for rack in range(plcs):
+        indices = list(range(rack * len(tags), (rack + 1) * len(tags)))
+        engine.add_plc("127.0.0.1", rack, 1, tags, indices, scan_period=period, tcpport=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plcs", type=int, default=8, help="endpoints to poll")
+    parser.add_argument("--tags", type=int, default=2000, help="tags per endpoint")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--period", type=float, default=0.01, help="scan period in seconds; short enough to always overrun")
+    parser.add_argument("--seconds", type=float, default=5.0, help="seconds to count values for, per run")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to let the workers start and connect")
+    parser.add_argument("--port", type=int, default=1102, help="port for the simulator's snap7 server")
+    args = parser.parse_args()
+
+    tags = make_tags(args.tags)
+    with PlcSimulator(tcpport=args.port) as simulator:
+        stop = threading.Event()
+
+        def mutate():
+            while not stop.wait(0.05):
+                simulator.mutate()
+
+        mutator = threading.Thread(target=mutate, daemon=True)
+        mutator.start()
+        try:
+            print(f"{args.plcs} endpoints x {args.tags} tags, {os.cpu_count()} CPUs")
+            print(f"{'engine':<16} {'values/s':>12} {'speedup':>8}")
+            engine = AcquisitionEngine(change_only=False)
+            add_plcs(engine, simulator.port, args.plcs, tags, args.period)
+            baseline = asyncio.run(measure(engine, args.seconds, args.warmup))
+            print(f"{'in process':<16} {baseline:>12.0f} {1.0:>7.2f}x")
+            for processes in args.processes:
+                engine = ShardedEngine(processes, change_only=False)
+                add_plcs(engine, simulator.port, args.plcs, tags, args.period)
+                rate = asyncio.run(measure(engine, args.seconds, args.warmup))
+                print(f"{f'{processes} processes':<16} {rate:>12.0f} {rate / baseline:>7.2f}x")
+        finally:
+            stop.set()
+            mutator.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+'''Cold import time of the Qt-free core, the headless daemon and the GUI, each in a fresh interpreter
+
+Every target is imported by a new Python process, several times, and the best
+time is reported with the heavy modules the import pulled in. Exits with status
+1 when a target loads a module it must not load at startup (Qt in the core,
+NumPy or multiprocessing in the daemon without --processes or --historian,
+NumPy or asyncio in the GUI before it reads) or takes longer than its budget,
+so it can guard startup time.
+
+Run from the repository root, e.g.:
+    python benchmarks/startup_benchmark.py --runs 5
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUI_PATH = os.path.join(ROOT, "read_memory_areas copy.py")
+ACQUIRE_PATH = os.path.join(ROOT, "acquire.py")
+# Modules worth knowing about when they are loaded at startup
+WATCHED = ["PyQt5", "numpy", "asyncio", "multiprocessing", "snap7", "sqlite3", "openpyxl"]
+CORE_MODULES = ["util.address", "util.codecs", "util.tags", "util.planner", "util.writer", "util.tagfile"]
+
+# (name, code to time, modules it must not load, budget in seconds)
+TARGETS = [
+    ("core", "import " + ", ".join(CORE_MODULES), ["PyQt5", "numpy", "asyncio"], 0.3),
+    ("engine", "import util.engine", ["PyQt5", "numpy"], 0.4),
+    ("acquire", f"import runpy; runpy.run_path({ACQUIRE_PATH!r}, run_name='acquire')",
+     ["PyQt5", "numpy", "multiprocessing"], 0.4),
+    ("gui", f"import runpy; runpy.run_path({GUI_PATH!r}, run_name='gui')", ["numpy", "asyncio"], 0.8),
+]
+
+PROBE = '''
+import sys, time, json
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {watched!r} if name in sys.modules]}}))
+'''
+
+
+def probe(code):
+    '''Times code in a new interpreter; returns (seconds, watched modules loaded)'''
+    script = PROBE.format(root=ROOT, code=code, watched=WATCHED)
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    return result["seconds"], result["loaded"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per target; the best time counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every budget, for slow machines")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'target':<8} {'best ms':>9} {'budget ms':>10}  loaded")
+    for name, code, forbidden, budget in TARGETS:
+        runs = [probe(code) for _ in range(args.runs)]
+        best = min(seconds for seconds, _ in runs)
+        loaded = runs[0][1]
+        budget *= args.scale
+        print(f"{name:<8} {best * 1000:>9.1f} {budget * 1000:>10.0f}  {', '.join(loaded)}")
+        if best > budget:
+            failures.append(f"{name} took {best * 1000:.0f} ms, more than its {budget * 1000:.0f} ms budget")
+        for module in forbidden:
+            if module in loaded:
+                failures.append(f"{name} imports {module} at startup")
+
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
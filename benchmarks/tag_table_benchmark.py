@@ -0,0 +1,48 @@
+'''Benchmark: 10k tags updating at 10 Hz in the tag table view
+
+Measures how long one batched update plus the repaint it causes takes; it
+has to stay well below the 100 ms cycle for the view to feel smooth.
+Run from the repository root: python benchmarks/tag_table_benchmark.py
+(set QT_QPA_PLATFORM=offscreen on a machine without a display)
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication, QTableView
+from util.tag_model import TagTableModel
+
+TAG_COUNT = 10000
+CYCLES = 50
+
+
+def main():
+    app = QApplication(sys.argv)
+    model = TagTableModel()
+    model.add_tags([
+        {"ip_address": "192.168.0.1", "name": f"tag_{i}", "type": "Int", "area": "M", "byte": str(i * 2), "bit": ""}
+        for i in range(TAG_COUNT)
+    ])
+    view = QTableView()
+    view.setModel(model)
+    view.resize(1000, 800)
+    view.show()
+    app.processEvents()
+
+    timings = []
+    for cycle in range(CYCLES):
+        changes = [(i, str(cycle * i)) for i in range(TAG_COUNT)]
+        start = time.perf_counter()
+        model.update_values(changes)
+        app.processEvents()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    print(f"{TAG_COUNT} tags changed per cycle, {CYCLES} cycles")
+    print(f"median {timings[len(timings) // 2] * 1000:.2f} ms, worst {timings[-1] * 1000:.2f} ms per cycle")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+'''End-to-end read throughput against the local PLC simulator
+
+Compares reading every tag with its own read_area call, coalesced blocks,
+and coalesced blocks packed into multi-var requests, for growing tag counts.
+Reports tags/s, cycle latency percentiles and bytes on the wire per cycle.
+
+Run from the repository root, e.g.:
+    python benchmarks/throughput_benchmark.py --latency 0.002 --counts 10 100 1000
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snap7
+from snap7.types import Areas
+from util.planner import plan_reads, read_request
+from util.simulator import DEFAULT_AREA_SIZE, DEFAULT_DB_NUMBERS, PlcSimulator
+from util.tags import compile_tags, tag_spans
+
+DEFAULT_COUNTS = [10, 100, 1000, 10000, 50000]
+TYPES = ['Bool', 'Int', 'DInt', 'Real', 'Word']
+AREAS = [('I', 0), ('Q', 0), ('M', 0)] + [(Areas.DB, number) for number in DEFAULT_DB_NUMBERS]
+
+
+def make_tags(count, seed=0):
+    '''Spreads count tags over I, Q, M and the DBs, about half as dense as a packed layout'''
+    rng = random.Random(seed)
+    span = min(max(64, count * 6 // len(AREAS)), DEFAULT_AREA_SIZE - 8)
+    tags = []
+    for i in range(count):
+        area, db_number = rng.choice(AREAS)
+        tag_type = rng.choice(TYPES)
+        tags.append({
+            "name": f"tag_{i}",
+            "type": tag_type,
+            "area": area,
+            "db_number": db_number,
+            "byte": rng.randrange(span),
+            "bit": rng.randrange(8) if tag_type == 'Bool' else "",
+        })
+    return tags
+
+
+def per_tag(compiled):
+    '''One read_area per tag, the way the tags were read before read planning'''
+    def cycle(plc):
+        for tag in compiled:
+            tag.decode(plc.read_area(tag.area, tag.db_number, tag.byte, tag.size), 0)
+    return cycle, len(compiled)
+
+
+def planned(compiled, multi_vars, pdu_length):
+    requests = plan_reads(tag_spans(compiled), pdu_length=pdu_length, multi_vars=multi_vars)
+
+    def cycle(plc):
+        for request in requests:
+            for block, data in zip(request, read_request(plc, request)):
+                for i, offset in block.members:
+                    compiled[i].decode(data, offset)
+    return cycle, len(requests)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run(simulator, plc, cycle, budget, max_cycles):
+    cycle(plc)  # warm up
+    simulator.proxy.reset_counters()
+    timings = []
+    started = time.perf_counter()
+    while not timings or (time.perf_counter() - started < budget and len(timings) < max_cycles):
+        start = time.perf_counter()
+        cycle(plc)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    wire = simulator.proxy.bytes_sent + simulator.proxy.bytes_received
+    return timings, wire / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=DEFAULT_COUNTS)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds to spend per method and count")
+    parser.add_argument("--max-cycles", type=int, default=100)
+    parser.add_argument("--port", type=int, default=1102, help="port for the simulator's snap7 server")
+    parser.add_argument("--pdu", type=int, help="PDU length to ask for, e.g. 240 like an S7-300 (the simulator caps it at 480)")
+    args = parser.parse_args()
+
+    with PlcSimulator(latency=args.latency, tcpport=args.port) as simulator:
+        plc = snap7.client.Client()
+        if args.pdu:
+            plc.set_param(snap7.types.PDURequest, args.pdu)
+        plc.connect("127.0.0.1", 0, 1, simulator.port)
+        pdu_length = plc.get_pdu_length()
+        print(f"PDU {pdu_length} bytes, latency {args.latency * 1000:.1f} ms per request")
+        print(f"{'tags':>6} {'method':<10} {'requests':>8} {'tags/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'bytes/cycle':>12}")
+        for count in args.counts:
+            compiled = compile_tags(make_tags(count))
+            methods = [
+                ("per tag", per_tag(compiled)),
+                ("blocks", planned(compiled, False, pdu_length)),
+                ("multi-var", planned(compiled, True, pdu_length)),
+            ]
+            for label, (cycle, requests) in methods:
+                timings, wire = run(simulator, plc, cycle, args.budget, args.max_cycles)
+                tags_per_second = count * len(timings) / sum(timings)
+                print(f"{count:>6} {label:<10} {requests:>8} {tags_per_second:>11.0f} "
+                      f"{percentile(timings, 0.5) * 1000:>9.2f} {percentile(timings, 0.99) * 1000:>9.2f} {wire:>12.0f}")
+        plc.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+'''Write throughput against the local PLC simulator
+
+Compares writing every tag with its own request (BOOLs with their own
+read-modify-write) against queuing the same writes in a WriteQueue, which
+merges adjacent bytes and packs them into write_multi_vars requests.
+
+Run from the repository root, e.g.:
+    python benchmarks/write_benchmark.py --latency 0.002 --counts 10 100 1000
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snap7
+from throughput_benchmark import make_tags, percentile
+from util.simulator import PlcSimulator
+from util.tags import compile_tags
+from util.writer import WriteQueue
+
+DEFAULT_COUNTS = [10, 100, 1000, 10000]
+
+
+def make_values(compiled, seed=0):
+    rng = random.Random(seed)
+    values = []
+    for tag in compiled:
+        if tag.type == 'BOOL':
+            values.append(rng.random() < 0.5)
+        elif tag.type == 'REAL':
+            values.append(rng.uniform(-1000, 1000))
+        elif tag.type in ('INT', 'DINT'):
+            values.append(rng.randrange(-30000, 30000))
+        else:
+            values.append(rng.randrange(65536))
+    return values
+
+
+def per_tag(compiled, values):
+    '''One write_area per tag; a BOOL reads its byte, sets the bit and writes the byte back'''
+    def cycle(plc):
+        for tag, value in zip(compiled, values):
+            if tag.type == 'BOOL':
+                data = plc.read_area(tag.area, tag.db_number, tag.byte, 1)
+            else:
+                data = bytearray(tag.size)
+            tag.encode(data, 0, value)
+            plc.write_area(tag.area, tag.db_number, tag.byte, data)
+    return cycle
+
+
+def batched(compiled, values, pdu_length):
+    queue = WriteQueue(pdu_length)
+
+    def cycle(plc):
+        for tag, value in zip(compiled, values):
+            queue.put(tag, value)
+        return queue.flush(plc)
+    return cycle
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=DEFAULT_COUNTS)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds to spend per method and count")
+    parser.add_argument("--max-cycles", type=int, default=100)
+    parser.add_argument("--port", type=int, default=1102, help="port for the simulator's snap7 server")
+    args = parser.parse_args()
+
+    with PlcSimulator(latency=args.latency, tcpport=args.port) as simulator:
+        plc = snap7.client.Client()
+        plc.connect("127.0.0.1", 0, 1, simulator.port)
+        pdu_length = plc.get_pdu_length()
+        print(f"PDU {pdu_length} bytes, latency {args.latency * 1000:.1f} ms per request")
+        print(f"{'tags':>6} {'method':<10} {'requests':>8} {'writes/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'bytes/cycle':>12}")
+        for count in args.counts:
+            compiled = compile_tags(make_tags(count))
+            values = make_values(compiled)
+            for label, cycle in [("per tag", per_tag(compiled, values)), ("batched", batched(compiled, values, pdu_length))]:
+                cycle(plc)  # warm up
+                simulator.proxy.reset_counters()
+                timings = []
+                started = time.perf_counter()
+                while not timings or (time.perf_counter() - started < args.budget and len(timings) < args.max_cycles):
+                    start = time.perf_counter()
+                    cycle(plc)
+                    timings.append(time.perf_counter() - start)
+                requests = simulator.proxy.requests / len(timings)
+                wire = (simulator.proxy.bytes_sent + simulator.proxy.bytes_received) / len(timings)
+                timings.sort()
+                print(f"{count:>6} {label:<10} {requests:>8.0f} {count * len(timings) / sum(timings):>11.0f} "
+                      f"{percentile(timings, 0.5) * 1000:>9.2f} {percentile(timings, 0.99) * 1000:>9.2f} {wire:>12.0f}")
+        plc.disconnect()
+
+
+if __name__ == "__main__":
+    main()
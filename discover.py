@@ -0,0 +1,35 @@
+'''Finds S7 PLCs on a network and prints their CPU info
+
+Example:
+    python discover.py 192.168.0.0/22
+'''
+import argparse
+import asyncio
+import time
+
+from util.discovery import DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT, S7_PORT, discover, hosts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Find S7 PLCs on a network")
+    parser.add_argument("network", help="address range in CIDR notation, e.g. 192.168.0.0/24")
+    parser.add_argument("--port", type=int, default=S7_PORT)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="connects in flight at once")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for each connect")
+    return parser.parse_args(argv)
+
+
+def print_plc(info):
+    print(f"{info.ip_address:<15} rack {info.rack} slot {info.slot}  {info.module_type or '?'}  "
+          f"{info.order_code} {info.firmware}  {info.as_name}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    found = asyncio.run(discover(args.network, args.port, args.concurrency, args.timeout, on_found=print_plc))
+    print(f"{len(found)} PLCs in {len(hosts(args.network))} addresses, {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
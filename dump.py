@@ -0,0 +1,103 @@
+'''Dumps whole memory areas of a PLC to snapshot files and diffs two snapshots
+
+Examples:
+    python dump.py snapshot before --ip 192.168.0.1 --areas I Q M DB1 DB5
+    python dump.py snapshot after --ip 192.168.0.1 --areas I Q M DB1 DB5
+    python dump.py diff before/DB5.snap after/DB5.snap --tags tags.json
+    python dump.py diff before/M.snap after/M.snap --as Int --bits
+'''
+import argparse
+import os
+import time
+
+from util.dump import (DEFAULT_CONNECTIONS, bit_changes, connect_clients, decode_as, decode_tags, diff_snapshots,
+                       dump_area, open_snapshot, parse_area, probe_size, snapshot_name)
+from util.tagfile import load_tags
+from util.tags import AREA_MAPPING, compile_tags
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot and diff whole PLC memory areas")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = commands.add_parser("snapshot", help="dump areas into a directory of snapshot files")
+    snapshot.add_argument("directory")
+    snapshot.add_argument("--ip", default="192.168.0.1")
+    snapshot.add_argument("--rack", type=int, default=0)
+    snapshot.add_argument("--slot", type=int, default=1)
+    snapshot.add_argument("--port", type=int, default=102)
+    snapshot.add_argument("--areas", nargs="+", default=["I", "Q", "M"], help="I, Q, M or DB<number>")
+    snapshot.add_argument("--size", type=int, help="bytes to dump per area; probed for each area if left out")
+    snapshot.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS,
+                          help="connections reading at the same time")
+
+    diff = commands.add_parser("diff", help="show what changed between two snapshots of an area")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--tags", help="tag file (.json/.csv/.db) to decode changed tags with")
+    diff.add_argument("--as", dest="type_name", help="decode the changed bytes as this type, e.g. Int or Real")
+    diff.add_argument("--bits", action="store_true", help="list every flipped bit")
+    return parser.parse_args(argv)
+
+
+def snapshot(args):
+    os.makedirs(args.directory, exist_ok=True)
+    clients = connect_clients(args.ip, args.rack, args.slot, args.connections, args.port)
+    try:
+        pdu_length = clients[0].get_pdu_length()
+        for text in args.areas:
+            area, db_number = parse_area(text)
+            size = args.size if args.size is not None else probe_size(clients[0], area, db_number)
+            path = os.path.join(args.directory, snapshot_name(area, db_number))
+            seconds = dump_area(clients, area, db_number, size, path, pdu_length, ip_address=args.ip)
+            rate = size / seconds / 1024 if seconds else 0
+            print(f"{path}: {size} bytes in {seconds * 1000:.0f} ms ({rate:.0f} KiB/s)")
+    finally:
+        for plc in clients:
+            plc.disconnect()
+
+
+def diff(args):
+    old_header, old = open_snapshot(args.old)
+    new_header, new = open_snapshot(args.new)
+    if (old_header["area"], old_header["db_number"]) != (new_header["area"], new_header["db_number"]):
+        print(f"Warning: comparing {old_header['area']}{old_header['db_number'] or ''} "
+              f"with {new_header['area']}{new_header['db_number'] or ''}")
+    if len(old) != len(new):
+        print(f"Warning: sizes differ ({len(old)} and {len(new)} bytes), comparing the first {min(len(old), len(new))}")
+
+    started = time.perf_counter()
+    offsets, old_bytes, new_bytes, flipped = diff_snapshots(old, new)
+    elapsed = time.perf_counter() - started
+    print(f"{len(offsets)} of {min(len(old), len(new))} bytes changed (compared in {elapsed * 1000:.1f} ms)")
+
+    if args.bits:
+        for byte, bit, state in zip(*bit_changes(offsets, flipped, new_bytes)):
+            print(f"  {byte}.{bit}: {int(not state)} -> {int(state)}")
+    elif not args.tags and not args.type_name:
+        for offset, before, after in zip(offsets, old_bytes, new_bytes):
+            print(f"  {offset}: {before:#04x} -> {after:#04x}")
+
+    if args.tags:
+        area = AREA_MAPPING[new_header["area"]]
+        db_number = new_header["db_number"]
+        compiled = [tag for tag in compile_tags(load_tags(args.tags))
+                    if tag is not None and tag.area == area and tag.db_number == db_number]
+        for tag, before, after in decode_tags(compiled, old, new, offsets):
+            print(f"  {tag.name} ({tag.type} at {tag.byte}{'.' + str(tag.bit) if tag.bit is not None else ''}): "
+                  f"{before} -> {after}")
+    if args.type_name:
+        for offset, before, after in decode_as(args.type_name, old, new, offsets):
+            print(f"  {offset}: {before} -> {after}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "snapshot":
+        snapshot(args)
+    else:
+        diff(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
+import os
 import sys
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QApplication, QMainWindow, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget, QMenu, QComboBox, QStyledItemDelegate
-import openpyxl
+from itertools import chain, islice
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QApplication, QMainWindow, QTableView, QTabWidget, QWidget, QMenu, QComboBox, QStyledItemDelegate
 from PyQt5.QtGui import QColor
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.tagimport import ImportedRow, is_tag_sheet, iter_rows, iter_tags, sheet_names
+
+# Rows read each time a view scrolls to the end of what has been read; small enough to keep the window responsive
+CHUNK_SIZE = 1000
+
 
 class dataTypeDelegate(QStyledItemDelegate):
     ''' Delegate for the data type columns '''
@@ -62,49 +70,151 @@ class dataTypeDelegate(QStyledItemDelegate):
     def updateEditorGeometry(self, editor, option, index):
         editor.setGeometry(option.rect)
 
+class SheetModel(QAbstractTableModel):
+    '''Rows of one sheet, read from a stream of rows only as far as a view scrolls (canFetchMore/fetchMore)'''
+
+    def __init__(self, header, rows, parent=None):
+        super().__init__(parent)
+        self.header = list(header)
+        self.rows = []
+        # Plain row tuples, or ImportedRows for a tag sheet
+        self.stream = rows
+        self.exhausted = False
+        # Compiled tags of the rows read so far, and the rows that didn't compile
+        self.tags = []
+        self.errors = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.header)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            row = self.rows[index.row()]
+            return row[index.column()] if index.column() < len(row) else ""
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.header[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole:
+            return False
+        row = list(self.rows[index.row()])
+        row.extend("" for _ in range(len(self.header) - len(row)))
+        row[index.column()] = value
+        self.rows[index.row()] = tuple(row)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        chunk = list(islice(self.stream, CHUNK_SIZE))
+        if len(chunk) < CHUNK_SIZE:
+            self.exhausted = True
+            self.stream = None
+        values = []
+        for row in chunk:
+            if not isinstance(row, ImportedRow):
+                values.append(row)
+                continue
+            values.append(row.values)
+            if row.error is None:
+                self.tags.append(row.compiled)
+            else:
+                self.errors.append((row.line, row.error))
+        if values:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(values) - 1)
+            self.rows.extend(values)
+            self.endInsertRows()
+
+    def fetch_all(self):
+        while self.canFetchMore():
+            self.fetchMore()
+
+
 class ExcelImporter(QMainWindow):
     def __init__(self, file_path):
         super().__init__()
 
         self.file_path = file_path
+        # One SheetModel per sheet, None until its tab is first opened
+        self.models = {}
         self.init_ui()
 
     def init_ui(self):
         self.setWindowTitle("Excel Importer")
 
-        # Create the central widget and layout
-        self.central_widget = QWidget(self)
-        self.setCentralWidget(self.central_widget)
-        self.layout = QVBoxLayout(self.central_widget)
-
-        # Load the Excel workbook
-        self.workbook = openpyxl.load_workbook(self.file_path)
-
-        # Add a QTableWidget for each sheet in the workbook
-        for sheet_name in self.workbook.sheetnames:
-            sheet = self.workbook[sheet_name]
-            table_widget = self.create_table_widget(sheet)
-            self.layout.addWidget(table_widget)
-
-    def create_table_widget(self, sheet):
-        # Create a QTableWidget with the same number of rows and columns as the sheet
-        header_labels = [str(cell.value) for cell in sheet[1]]
-        table_widget = QTableWidget(sheet.max_row, sheet.max_column)
-        table_widget.setHorizontalHeaderLabels(header_labels)
+        # A tab per sheet; a sheet is only opened when its tab is first shown
+        self.tabs = QTabWidget(self)
+        self.setCentralWidget(self.tabs)
+        for sheet_name in sheet_names(self.file_path):
+            self.models[sheet_name] = None
+            self.tabs.addTab(QWidget(), sheet_name)
+        self.tabs.currentChanged.connect(self.open_sheet)
+        if self.tabs.count():
+            self.open_sheet(self.tabs.currentIndex())
+
+    @property
+    def tags(self):
+        '''Compiled tags of the tag sheet rows read so far'''
+        return [tag for model in self.models.values() if model is not None for tag in model.tags]
+
+    @property
+    def errors(self):
+        return [error for model in self.models.values() if model is not None for error in model.errors]
+
+    def open_sheet(self, tab):
+        sheet_name = self.tabs.tabText(tab)
+        if self.models.get(sheet_name) is None:
+            # Only the header row is read here, the view fetches the rest as it scrolls
+            rows = iter_rows(self.file_path, sheet_name)
+            header = next(rows, ())
+            if is_tag_sheet(header):
+                rows = iter_tags(chain([header], rows))
+            model = SheetModel(header, rows, self)
+            model.rowsInserted.connect(self.show_progress)
+            self.models[sheet_name] = model
+            placeholder = self.tabs.widget(tab)
+            self.tabs.blockSignals(True)
+            self.tabs.removeTab(tab)
+            self.tabs.insertTab(tab, self.create_table_widget(model), sheet_name)
+            self.tabs.setCurrentIndex(tab)
+            self.tabs.blockSignals(False)
+            placeholder.deleteLater()
+        self.show_progress()
+
+    def show_progress(self):
+        model = self.models.get(self.tabs.tabText(self.tabs.currentIndex()))
+        if model is None:
+            return
+        more = ", more below" if model.canFetchMore() else ""
+        self.statusBar().showMessage(f"{len(model.rows)} rows read{more}; "
+                                     f"{len(self.tags)} tags, {len(self.errors)} rows with errors")
+
+    def create_table_widget(self, model):
+        table_widget = QTableView()
+        table_widget.setModel(model)
         table_widget.setContextMenuPolicy(Qt.CustomContextMenu)
         table_widget.customContextMenuRequested.connect(self.show_context_menu)
         table_widget.setAlternatingRowColors(True)
         # table_widget.setItemDelegate(CustomDelegate())
         # Find 'Data Type' column index and set the custom delegate for it
-        for col_num, header_label in enumerate(header_labels):
+        for col_num, header_label in enumerate(model.header):
             if header_label == "Data Type":
-                table_widget.setItemDelegateForColumn(col_num, dataTypeDelegate())
-
-
-        # Populate the table with data from the sheet
-        for row_num, row in enumerate(sheet.iter_rows(min_row=2), start=1):
-            for col_num, cell in enumerate(row, start=0):
-                table_widget.setItem(row_num - 1, col_num, QTableWidgetItem(str(cell.value)))
+                table_widget.setItemDelegateForColumn(col_num, dataTypeDelegate(table_widget))
 
         return table_widget
 
@@ -1,7 +1,12 @@
+import os
 import sys
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLineEdit
-from PyQt5.QtGui import QRegExpValidator, QKeyEvent
-from PyQt5.QtCore import QRegExp
+from PyQt5.QtGui import QRegularExpressionValidator, QKeyEvent
+from PyQt5.QtCore import QRegularExpression
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.address import ADDRESS_REGEX
 
 class CapitalizingLineEdit(QLineEdit):
     def keyPressEvent(self, event: QKeyEvent) -> None:
@@ -32,11 +37,8 @@ class MainWindow(QWidget):
         # Create a QLineEdit
         line_edit = CapitalizingLineEdit()
 
-        # Set the regex pattern
-        regex_pattern = r'^%[IQM](?:[BW]?[0-9]{1,16}(?:\.[0-7])?|B[01])$|^%[QW][1-9]\d?$|^%[M][B1]|[MW][1-9]\d?\d?$'
-
-        # Create a QRegExpValidator with the regex pattern
-        validator = QRegExpValidator(QRegExp(regex_pattern))
+        # Validate against the same address grammar the tag table uses
+        validator = QRegularExpressionValidator(QRegularExpression(ADDRESS_REGEX))
 
         # Set the validator for the QLineEdit
         line_edit.setValidator(validator)
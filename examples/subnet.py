@@ -1,8 +1,13 @@
+import os
 import sys
 from PyQt5.QtWidgets import QApplication, QLabel, QLineEdit, QVBoxLayout, QWidget, QPushButton
 from PyQt5.QtCore import QRegExp
 from PyQt5.QtGui import QRegExpValidator
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.discovery_dialog import DiscoveryDialog
+
 class IPAddressLineEdit(QLineEdit):
     def __init__(self):
         super().__init__()
@@ -29,6 +34,10 @@ class MainWindow(QWidget):
         self.subnet_mask_label = QLabel()
         layout.addWidget(self.subnet_mask_label)
 
+        self.scan_button = QPushButton("Scan for PLCs")
+        self.scan_button.clicked.connect(self.scan_subnet)
+        layout.addWidget(self.scan_button)
+
         self.setLayout(layout)
 
     def calculate_subnet_mask(self):
@@ -49,6 +58,10 @@ class MainWindow(QWidget):
         except ValueError:
             pass
 
+    def scan_subnet(self):
+        dialog = DiscoveryDialog(self.ip_address_input.text(), parent=self)
+        dialog.exec_()
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     main_window = MainWindow()
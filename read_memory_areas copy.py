@@ -1,17 +1,24 @@
-import re
 import sys
-import snap7
-from snap7 import util
-from snap7.util import * 
 import time
-from PyQt5.QtWidgets import QApplication, QMainWindow, QComboBox, QStyledItemDelegate, QHBoxLayout, QLabel, QLineEdit, QPushButton, QWidget, QTableWidget, QTableWidgetItem, QHeaderView, QStatusBar, QDialog, QVBoxLayout, QLabel, QLineEdit, QDialogButtonBox, QAction
+from PyQt5.QtWidgets import QApplication, QMainWindow, QComboBox, QInputDialog, QStyledItemDelegate, QHBoxLayout, QLabel, QLineEdit, QPushButton, QWidget, QTableView, QHeaderView, QStatusBar, QDialog, QVBoxLayout, QLabel, QLineEdit, QDialogButtonBox, QAction
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSettings, QTimer
 from PyQt5.QtGui import QIcon
 import json
+import os
+# The engine (asyncio), the historian (NumPy) and PLC discovery are imported when first used, so the window opens fast
+from util.metrics import Metrics
+from util.metrics_panel import MetricsPanel
+from util.address import AddressError, address_fields, parse_address
+from util.tags import compile_tag
+from util.tag_model import SCAN_COLUMN, TYPE_COLUMN, VALUE_COLUMN, TagTableModel
+from util.writer import parse_value
+from util.tagstore import DEFAULT_SET, TagStore
 # Default settings. These will be overwritten by the settings file if it exists.
 IP_ADDRESS = "192.168.0.1"
 RACK = 0
 SLOT = 1
+# Where "Record" writes the values it reads (see util/historian.py)
+HISTORY_DIRECTORY = os.path.join(os.path.expanduser("~"), ".snap7_tools", "history")
 
 class dataTypeDelegate(QStyledItemDelegate):
     ''' Delegate for the data type columns '''
@@ -70,82 +77,94 @@ class dataTypeDelegate(QStyledItemDelegate):
     def updateEditorGeometry(self, editor, option, index):
         editor.setGeometry(option.rect)
 
+class scanClassDelegate(QStyledItemDelegate):
+    ''' Delegate for the scan class column '''
+
+    def createEditor(self, parent, option, index):
+        from util.engine import SCAN_CLASSES
+        editor = QComboBox(parent)
+        editor.addItems(SCAN_CLASSES)
+        return editor
+
+    def setEditorData(self, editor, index):
+        value = index.model().data(index, Qt.EditRole)
+        if value:
+            editor.setCurrentText(value)
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.EditRole)
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(option.rect)
+
 class TagUpdateWorker(QThread):
     '''Worker thread that reads the tags from the PLC and updates the table'''
 
-    update_tag_signal = pyqtSignal(int, str)
+    # One batch of (row, value) pairs per cycle, holding only the tags that changed
+    update_tags_signal = pyqtSignal(list)
     connection_status_signal = pyqtSignal(bool)
+    link_status_signal = pyqtSignal(str)
 
-    def __init__(self, tags):
+    def __init__(self, tags, recorder=None, metrics=None):
         super().__init__()
-        self.tags = tags
-
-
-    def read_tag(self, plc, tag):
-        area_mapping = {
-            'I': snap7.types.Areas.PE,
-            'Q': snap7.types.Areas.PA,
-            'M': snap7.types.Areas.MK,
-            'IW': snap7.types.Areas.PE,
-            'MB': snap7.types.Areas.DB,
-            'MW': snap7.types.Areas.CT,
-            'QW': snap7.types.Areas.TM
-        }
-
-        area = area_mapping.get(tag['area'])
-        byte = int(tag['byte'])
-        if tag['bit']:
-            bit = int(tag['bit'])
-            
-        tag['type'] = tag['type'].upper()
-        try:
-
-            if tag['type'] == 'BOOL':
-                data = plc.read_area(area, 0, byte, 1)
-                value = util.get_bool(data, 0, bit)
-            elif tag['type'] == 'INT':
-                data = plc.read_area(area, 0, byte, 2)
-                value = util.get_int(data, 0)
-            elif tag['type'] == 'DINT':
-                data = plc.read_area(area, 0, byte, 4)
-                value = util.get_dint(data, 0)
-            elif tag['type'] == 'REAL':
-                data = plc.read_area(area, 0, byte, 4)
-                value = util.get_real(data, 0)
-            elif tag['type'] == 'WORD':
-                data = plc.read_area(area, 0, byte, 2)
-                value = util.get_word(data, 0)
-            elif tag['type'] == 'DWORD':
-                data = plc.read_area(area, 0, byte, 4)
-                value = util.get_dword(data, 0)
-            else:
-                raise ValueError(f"Unsupported tag type: {tag['type']}")
-            
-        except ValueError as e:
-            print(f"Error reading tag '{tag['name']}': {e}")
-            value = None
-
-        return value
+        # A copy, so rows added to the table while reading don't shift the tags the engine reads
+        self.tags = list(tags)
+        # util.metrics.Metrics to time the scans and signal emits into, or None
+        self.metrics = metrics
+        # Sink every result is also written to, e.g. a HistorianSink
+        self.recorder = recorder
+        self.names = [tag.get("name", "") for tag in tags]
+        self.engine = None
+
+    def write(self, row, value):
+        '''Queues a write to the tag of a row; it goes out with the next scan of its PLC'''
+        if self.engine is None:
+            raise ValueError("Not reading yet")
+        self.engine.write(row, value)
+
+    def instrument(self, metrics):
+        '''Starts timing into metrics, or stops with None, while running'''
+        self.metrics = metrics
+        if self.engine is not None:
+            self.engine.instrument(metrics)
 
     def run(self):
-        plc = snap7.client.Client()
-        try:
-            plc.connect(IP_ADDRESS, RACK, SLOT)
-            self.connection_status_signal.emit(True)
-        except:
-            self.connection_status_signal.emit(False)
-            return
-
-        while not self.isInterruptionRequested():
-            for i, tag in enumerate(self.tags):
-                try:
-                    value = self.read_tag(plc, tag)
-                    self.update_tag_signal.emit(i, str(value))
-                except:
-                    pass
-            time.sleep(0.1)
-
-        plc.disconnect()
+        from util.engine import AcquisitionEngine, run_batches
+        engine = AcquisitionEngine(metrics=self.metrics)
+        self.engine = engine
+        # Every tag is read from its own PLC; tags without an address use the one from the settings
+        engine.add_tags(self.tags, RACK, SLOT, scan_period=0.1, default_ip_address=IP_ADDRESS)
+        self.connected = {}
+        self.link_status = None
+        run_batches(engine, self.publish, self.isInterruptionRequested)
+
+    def publish(self, results):
+        '''Forwards one batch of engine results to the table'''
+        engine = self.engine
+        changes = []
+        for result in results:
+            if self.recorder is not None:
+                self.recorder.write(result, self.names)
+            if self.connected.get(result.ip_address) != result.connected:
+                self.connected[result.ip_address] = result.connected
+                self.connection_status_signal.emit(all(self.connected.values()))
+            changes.extend((i, str(value)) for i, value in result.values)
+        summary = engine.link_summary()
+        overruns = engine.scan_summary()
+        if overruns:
+            summary = f"{summary}, {overruns}"
+        if summary != self.link_status:
+            self.link_status = summary
+            self.link_status_signal.emit(summary)
+        if changes:
+            metrics = self.metrics
+            if metrics is None:
+                self.update_tags_signal.emit(changes)
+            else:
+                start = time.perf_counter()
+                self.update_tags_signal.emit(changes)
+                end = time.perf_counter()
+                metrics.histogram("signal emit").record(end - start, end)
 
 class SettingsDialog(QDialog):
     '''Dialog that allows the user to change the IP address, rack, and slot of the PLC'''
@@ -171,6 +190,10 @@ class SettingsDialog(QDialog):
         layout.addWidget(self.slot_label)
         layout.addWidget(self.slot_input)
 
+        self.find_button = QPushButton("Find PLCs...")
+        self.find_button.clicked.connect(self.find_plcs)
+        layout.addWidget(self.find_button)
+
         button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
@@ -178,6 +201,16 @@ class SettingsDialog(QDialog):
 
         self.setLayout(layout)
 
+    def find_plcs(self):
+        '''Scans the /24 of the current address and fills in the PLC the user picks'''
+        from util.discovery_dialog import DiscoveryDialog
+        dialog = DiscoveryDialog(f"{self.ip_input.text()}/24", parent=self)
+        if dialog.exec_() == QDialog.Accepted and dialog.selected() is not None:
+            info = dialog.selected()
+            self.ip_input.setText(info.ip_address)
+            self.rack_input.setText(str(info.rack))
+            self.slot_input.setText(str(info.slot))
+
     def get_values(self):
         return self.ip_input.text(), int(self.rack_input.text()), int(self.slot_input.text())
 
@@ -203,6 +236,14 @@ class MainWindow(QMainWindow):
         self.settings_button.clicked.connect(self.open_settings_dialog)
         self.tag_input_layout.addWidget(self.settings_button)
 
+        self.tag_set_combo_box = QComboBox()
+        self.tag_set_combo_box.setToolTip("Tag set")
+        self.tag_input_layout.addWidget(self.tag_set_combo_box)
+
+        self.new_set_button = QPushButton("New Set")
+        self.new_set_button.clicked.connect(self.new_tag_set)
+        self.tag_input_layout.addWidget(self.new_set_button)
+
         sources = ["Memory", "Datablock"]
 
         self.source_combo_box = QComboBox()
@@ -243,6 +284,17 @@ class MainWindow(QMainWindow):
         self.tag_input_layout.addWidget(self.stop_button)
         self.stop_button.clicked.connect(self.stop_reading)
 
+        self.record_button = QPushButton("Record")
+        self.record_button.setCheckable(True)
+        self.record_button.setToolTip(f"Record the values read to {HISTORY_DIRECTORY}")
+        self.tag_input_layout.addWidget(self.record_button)
+
+        self.write_button = QPushButton("Write Value")
+        self.write_button.setToolTip("Write a value to the selected tags while reading")
+        self.tag_input_layout.addWidget(self.write_button)
+        self.write_button.clicked.connect(self.write_value)
+        self.write_button.setEnabled(False)
+
         self.save_button = QPushButton(QIcon("floppy_disk_icon.svg"), "Save Tags")
         self.tag_input_layout.addWidget(self.save_button)
         self.save_button.clicked.connect(self.save_tags)
@@ -250,19 +302,47 @@ class MainWindow(QMainWindow):
         self.start_button.setEnabled(True)
         self.stop_button.setEnabled(False)
         
-        self.tag_table = QTableWidget()
+        self.tag_model = TagTableModel(self)
+        self.tag_table = QTableView()
         self.layout.addWidget(self.tag_table)
-        self.tag_table.setColumnCount(7)
-        self.tag_table.setHorizontalHeaderLabels(["IP", "Name", "Type", "area", "Byte", "Bit", "Value"])
-        self.tag_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
-        self.tag_table.setItemDelegateForColumn(2, dataTypeDelegate())
+        self.tag_table.setModel(self.tag_model)
+        self.tag_table.setSelectionBehavior(QTableView.SelectRows)
+        # Sizing columns to their contents on every update would measure every row, so only sample some
+        self.tag_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.tag_table.horizontalHeader().setResizeContentsPrecision(100)
+        self.tag_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.type_delegate = dataTypeDelegate()
+        self.tag_table.setItemDelegateForColumn(TYPE_COLUMN, self.type_delegate)
+        self.scan_class_delegate = scanClassDelegate()
+        self.tag_table.setItemDelegateForColumn(SCAN_COLUMN, self.scan_class_delegate)
+        self.tag_model.dataChanged.connect(self.tag_edited)
 
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("Disconnected")
+        self.link_status_label = QLabel()
+        self.status_bar.addPermanentWidget(self.link_status_label)
+
+        # Timing stays off, and costs nothing, until the performance panel is opened
+        self.metrics = None
+        self.performance_label = QLabel()
+        self.status_bar.addPermanentWidget(self.performance_label)
+        self.metrics_panel = MetricsPanel(self)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.metrics_panel)
+        self.metrics_panel.hide()
+        self.performance_action = QAction("Performance Panel", self)
+        self.performance_action.setCheckable(True)
+        self.performance_action.toggled.connect(self.toggle_performance)
+        self.metrics_panel.visibilityChanged.connect(self.performance_action.setChecked)
+        self.menuBar().addMenu("View").addAction(self.performance_action)
+        self.performance_timer = QTimer(self)
+        self.performance_timer.timeout.connect(self.update_performance_label)
 
         self.load_settings()
+        self.tag_store = TagStore()
+        self.tag_set_id = None
         self.load_tags()
+        self.tag_set_combo_box.currentIndexChanged.connect(self.select_tag_set)
 
         # self.timer = QTimer()
         # self.timer.timeout.connect(self.check_connection)
@@ -279,18 +359,32 @@ class MainWindow(QMainWindow):
             RACK = rack
             SLOT = slot
             self.save_settings()
+            # Tag sets belong to a PLC, so list the ones of the new address
+            self.refresh_tag_sets()
+
+    def toggle_performance(self, enabled):
+        '''Switches timing and the performance panel on or off'''
+        if enabled == (self.metrics is not None):
+            return
+        self.metrics = Metrics() if enabled else None
+        self.metrics_panel.set_metrics(self.metrics)
+        self.metrics_panel.setVisible(enabled)
+        if hasattr(self, "tag_update_worker"):
+            self.tag_update_worker.instrument(self.metrics)
+        if enabled:
+            self.performance_timer.start(1000)
+        else:
+            self.performance_timer.stop()
+            self.performance_label.clear()
+
+    def update_performance_label(self):
+        self.performance_label.setText(self.metrics.summary(["request round trip", "decode", "table update"]))
 
     def add_tag_to_table(self, tag):
         '''Create a method to add tags to the table without modifying the global tags list. 
            This method will be used when loading tags from the saved settings'''
-        row_count = self.tag_table.rowCount()
-        self.tag_table.insertRow(row_count)
-        self.tag_table.setItem(row_count, 0, QTableWidgetItem(tag["ip_address"]))
-        self.tag_table.setItem(row_count, 1, QTableWidgetItem(tag["name"]))
-        self.tag_table.setItem(row_count, 2, QTableWidgetItem(tag["type"]))
-        self.tag_table.setItem(row_count, 3, QTableWidgetItem(tag["area"]))
-        self.tag_table.setItem(row_count, 4, QTableWidgetItem(tag["byte"]))
-        self.tag_table.setItem(row_count, 5, QTableWidgetItem(tag["bit"]))
+        self.tag_model.add_tags([tag])
+        self.tag_table.resizeColumnsToContents()
 
     def add_tag(self):
         ip_address = IP_ADDRESS  # You can replace this with a QLineEdit to input the IP address
@@ -298,15 +392,15 @@ class MainWindow(QMainWindow):
         address = self.address_input.text()
         tag_type = self.type_combo_box.currentText()
 
-        pattern = r'%([IQMB][W]?)(\d+)(?:\.(\d))?'
-
-        match = re.match(pattern, address)
-        if match:
-            area, before_decimal, after_decimal = match.groups()
-            print(area, before_decimal, after_decimal)
+        try:
+            fields = address_fields(parse_address(address))
+        except AddressError as e:
+            self.status_bar.showMessage(str(e))
+            return
 
-        if ip_address and address and area and before_decimal and tag_type:
-            tag = {"ip_address": ip_address, "name": name, "type": tag_type, "area": area, "byte": before_decimal, "bit": after_decimal}
+        if ip_address and tag_type:
+            tag = {"ip_address": ip_address, "name": name, "type": tag_type, **fields}
+            self.tag_store.add_tags(self.tag_set_id, [tag])
             self.tags.append(tag)
             self.add_tag_to_table(tag)
 
@@ -317,29 +411,74 @@ class MainWindow(QMainWindow):
 
     def remove_tag(self):
         '''Removes a tag from the table'''
-        selected_rows = self.tag_table.selectionModel().selectedRows()
-        for index in sorted(selected_rows, reverse=True):
-            row = index.row()
+        rows = {index.row() for index in self.tag_table.selectionModel().selectedRows()}
+        self.tag_store.remove_tags(self.tags[row]["id"] for row in rows)
+        for row in sorted(rows, reverse=True):
             del self.tags[row]
-            self.tag_table.removeRow(row)
+        self.tag_model.remove_rows(rows)
 
     def stop_reading(self):
         '''Stops reading the tags'''
         self.tag_update_worker.requestInterruption()
         self.tag_update_worker.wait()
+        if self.tag_update_worker.recorder is not None:
+            self.tag_update_worker.recorder.close()
         # self.tag_update_worker.terminate()
         self.start_button.setEnabled(True)
         self.stop_button.setEnabled(False)
+        self.write_button.setEnabled(False)
+        self.tag_set_combo_box.setEnabled(True)
+        self.new_set_button.setEnabled(True)
+        self.record_button.setEnabled(True)
+        self.add_button.setEnabled(True)
+        self.remove_button.setEnabled(True)
+        self.tag_table.setEditTriggers(self.edit_triggers)
         self.status_bar.showMessage("Disconnected from PLC")
 
     def start_reading(self):
         '''Starts reading the tags'''
-        self.tag_update_worker = TagUpdateWorker(self.tags)
-        self.tag_update_worker.update_tag_signal.connect(self.update_tag_value)
+        # Pick up edits made in the table since the tags were loaded
+        self.update_global_tags()
+        recorder = None
+        if self.record_button.isChecked():
+            from util.historian import HistorianSink
+            recorder = HistorianSink(HISTORY_DIRECTORY)
+        self.tag_update_worker = TagUpdateWorker(self.tags, recorder, self.metrics)
+        self.tag_update_worker.update_tags_signal.connect(self.update_tag_values)
         self.tag_update_worker.connection_status_signal.connect(self.update_connection_status)
+        self.tag_update_worker.link_status_signal.connect(self.link_status_label.setText)
         self.tag_update_worker.start()
         self.start_button.setEnabled(False)
         self.stop_button.setEnabled(True)
+        self.write_button.setEnabled(True)
+        # The worker reads the rows it was started with, and writes go to them by row,
+        # so neither the set nor its rows can change under it
+        self.tag_set_combo_box.setEnabled(False)
+        self.new_set_button.setEnabled(False)
+        self.record_button.setEnabled(False)
+        self.add_button.setEnabled(False)
+        self.remove_button.setEnabled(False)
+        self.edit_triggers = self.tag_table.editTriggers()
+        self.tag_table.setEditTriggers(QTableView.NoEditTriggers)
+
+    def write_value(self):
+        '''Asks for a value and queues a write of it to every selected tag'''
+        rows = sorted({index.row() for index in self.tag_table.selectionModel().selectedRows()})
+        if not rows:
+            self.status_bar.showMessage("Select the tags to write first")
+            return
+        worker = self.tag_update_worker
+        names = ", ".join(worker.names[row] for row in rows)
+        text, ok = QInputDialog.getText(self, "Write Value", f"Value for {names}:")
+        if not ok:
+            return
+        try:
+            for row in rows:
+                worker.write(row, parse_value(compile_tag(worker.tags[row]), text))
+        except (KeyError, ValueError) as e:
+            self.status_bar.showMessage(f"Could not write: {e}")
+            return
+        self.status_bar.showMessage(f"Writing {text} to {names}")
 
     def update_connection_status(self, connected):
         ''' Updates the connection status in the status bar'''
@@ -350,9 +489,15 @@ class MainWindow(QMainWindow):
         else:
             self.status_bar.showMessage("Disconnected")
 
-    def update_tag_value(self, index, value):
-        '''Updates the value of a tag in the table'''
-        self.tag_table.setItem(index, 6, QTableWidgetItem(value))
+    def update_tag_values(self, changes):
+        '''Updates the values of the tags that changed in one cycle'''
+        if self.metrics is None:
+            self.tag_model.update_values(changes)
+            return
+        start = time.perf_counter()
+        self.tag_model.update_values(changes)
+        end = time.perf_counter()
+        self.metrics.histogram("table update").record(end - start, end)
 
     def save_settings(self):
         ''' Saves the settings to the registry '''
@@ -370,59 +515,87 @@ class MainWindow(QMainWindow):
         SLOT = int(settings.value("slot", SLOT))
 
     def save_tags(self):
+        '''Writes every row of the table back to the tag database'''
         try:
-            settings = QSettings("testBench.cc", "readMemory")
             self.update_global_tags()
-            serializable_tags = [tag.copy() for tag in self.tags]
-            for tag in serializable_tags:
-                tag["area"] = tag["area"]  # Convert the area to an integer
-            tags_json = json.dumps(serializable_tags)
-            print(tags_json)
-            settings.setValue("tags", tags_json)
-        except Exception as e:
-            print(e)
+            self.tag_store.update_tags(self.tags)
+            self.status_bar.showMessage(f"Saved {len(self.tags)} tags")
+        except (KeyError, ValueError) as e:
+            self.status_bar.showMessage(f"Could not save tags: {e}")
+
+    def tag_edited(self, top_left, bottom_right, roles=()):
+        '''Saves the rows edited in the table; value updates are not saved'''
+        if top_left.column() == VALUE_COLUMN:
+            return
+        rows = range(top_left.row(), bottom_right.row() + 1)
+        for row in rows:
+            self.tags[row] = {**self.tags[row], **self.tag_model.tag(row)}
+        try:
+            self.tag_store.update_tags(self.tags[row] for row in rows)
+        except (KeyError, ValueError) as e:
+            self.status_bar.showMessage(f"Could not save tag: {e}")
 
     def load_tags(self):
+        '''Loads the active tag set, starting with the default set of the PLC the first time'''
+        set_id = self.tag_store.active_set
+        if set_id is None:
+            set_id = self.tag_store.tag_set(IP_ADDRESS, DEFAULT_SET)
+            self.import_settings_tags(set_id)
+        self.show_tag_set(set_id)
+        self.refresh_tag_sets()
+
+    def import_settings_tags(self, set_id):
+        '''Moves the tags of older versions, saved as JSON in the settings, into a tag set'''
+        settings = QSettings("testBench.cc", "readMemory")
+        tags_json = settings.value("tags")
+        if not tags_json:
+            return
         try:
-            settings = QSettings("testBench.cc", "readMemory")
-            tags_json = settings.value("tags")
-            if tags_json:
-                loaded_tags = json.loads(tags_json)
-                for tag in loaded_tags:
-                    tag["area"] = tag["area"]  # Convert the integer back to an area
-                self.tags = loaded_tags
-                for tag in self.tags:
-                    self.add_tag_to_table(tag)
-        except Exception as e:
-            print(e)
+            self.tag_store.add_tags(set_id, json.loads(tags_json))
+            settings.remove("tags")
+        except (KeyError, ValueError) as e:
+            print(f"Could not import the saved tags: {e}")
+
+    def show_tag_set(self, set_id):
+        '''Replaces the table with the tags of a set and makes it the one opened at startup'''
+        self.tag_model.clear()
+        self.tag_set_id = set_id
+        self.tag_store.active_set = set_id
+        self.tags = self.tag_store.load_tags(set_id)
+        self.tag_model.add_tags(self.tags)
+        self.tag_table.resizeColumnsToContents()
+
+    def refresh_tag_sets(self):
+        '''Lists the tag sets of the current PLC, keeping the shown set selected if it is one of them'''
+        tag_sets = self.tag_store.tag_sets(IP_ADDRESS)
+        if not tag_sets:
+            self.tag_store.tag_set(IP_ADDRESS, DEFAULT_SET)
+            tag_sets = self.tag_store.tag_sets(IP_ADDRESS)
+        self.tag_set_combo_box.blockSignals(True)
+        self.tag_set_combo_box.clear()
+        for set_id, _, name in tag_sets:
+            self.tag_set_combo_box.addItem(name, set_id)
+        index = self.tag_set_combo_box.findData(self.tag_set_id)
+        self.tag_set_combo_box.setCurrentIndex(max(index, 0))
+        self.tag_set_combo_box.blockSignals(False)
+        if index < 0:
+            self.show_tag_set(self.tag_set_combo_box.currentData())
+
+    def select_tag_set(self, index):
+        set_id = self.tag_set_combo_box.itemData(index)
+        if set_id is not None and set_id != self.tag_set_id:
+            self.show_tag_set(set_id)
+
+    def new_tag_set(self):
+        '''Asks for a name and switches to a new, empty tag set of the current PLC'''
+        name, ok = QInputDialog.getText(self, "New Tag Set", f"Name of the new tag set for {IP_ADDRESS}:")
+        if ok and name.strip():
+            self.show_tag_set(self.tag_store.tag_set(IP_ADDRESS, name.strip()))
+            self.refresh_tag_sets()
 
     def update_global_tags(self):
-        table_tags = []
-        for row in range(self.tag_table.rowCount()):
-            items = [self.tag_table.item(row, i) for i in range(6)]
-
-            # replace any none values with an empty string
-            items = [item if item else QTableWidgetItem("") for item in items]
-
-            name, tag_type, ip_address, area, byte, bit = (item.text() for item in items)
-
-            print(name, tag_type, ip_address, area, byte, bit)
-
-            # set the tag area, byte and bit depending on the tag type and name
-            # a tag named
-
-            tag = {
-                "name": name,
-                "type": tag_type,
-                "ip_address": ip_address,
-                "area": area,
-                "byte": byte,
-                "bit": bit,
-            }
-            table_tags.append(tag)
-
-        self.tags = table_tags
-        print(self.tags)
+        '''Copies the table contents back into the tag list, keeping keys the table doesn't show'''
+        self.tags = [{**tag, **row} for tag, row in zip(self.tags, self.tag_model.tags())]
 
 
 
@@ -1,11 +1,8 @@
 import sys
-import snap7
-from snap7.util import *
 import time
 from PyQt5.QtWidgets import QApplication, QMainWindow, QComboBox, QHBoxLayout, QLabel, QLineEdit, QPushButton, QWidget, QTableWidget, QTableWidgetItem, QHeaderView, QStatusBar, QDialog, QVBoxLayout, QLabel, QLineEdit, QDialogButtonBox, QAction
 from PyQt5.QtCore import QThread, pyqtSignal, QSettings, QTimer
 from PyQt5.QtGui import QIcon
-import json
 
 
 # Default settings. These will be overwritten by the settings file if it exists.
@@ -20,6 +17,7 @@ class TagUpdateWorker(QThread):
     connection_status_signal = pyqtSignal(bool)
 
     def run(self):
+        import snap7
         plc = snap7.client.Client()
         try:
             plc.connect(IP_ADDRESS, RACK, SLOT)
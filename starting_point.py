@@ -1,11 +1,14 @@
 import snap7
-from snap7.util import *
 import time
+from util.planner import plan_reads, read_request
+from util.tags import compile_tags, tag_spans
 
 # Replace IP_ADDRESS with the IP address of your PLC
 IP_ADDRESS = "192.168.0.244"
 RACK = 0
 SLOT = 1
+# Seconds from the start of one scan to the start of the next
+SCAN_PERIOD = 1.0
 
 # Define the tags
 tags = [
@@ -23,26 +26,30 @@ def main():
     plc = snap7.client.Client()
     plc.connect(IP_ADDRESS, RACK, SLOT)
 
+    # Read each contiguous range once and decode all of its tags from the same buffer
+    compiled = compile_tags(tags)
+    requests = plan_reads(tag_spans(compiled))
+    values = [None] * len(tags)
+
     try:
+        next_scan = time.monotonic()
         while True:
+            for request in requests:
+                for block, data in zip(request, read_request(plc, request)):
+                    for i, offset in block.members:
+                        values[i] = compiled[i].decode(data, offset)
+
+            # clear the terminal
             print("\033c", end="")
-            for tag in tags:
-                value = read_tag(plc, tag)
-                # clear the terminal
+            for tag, value in zip(tags, values):
                 print(f"{tag['name']}:", value)
-            time.sleep(1)  # Adjust the sleep time according to your needs
+            # Sleep until the next deadline, so the time spent reading counts towards the period
+            next_scan += SCAN_PERIOD
+            time.sleep(max(0.0, next_scan - time.monotonic()))
     except KeyboardInterrupt:
         print("Terminating...")
     finally:
         plc.disconnect()
 
-def read_tag(plc, tag):
-    if tag["type"] == "bool":
-        data = plc.read_area(tag["area"], 0, tag["byte"], 1)
-        return get_bool(data, 0, tag["bit"])
-    elif tag["type"] == "int":
-        data = plc.read_area(tag["area"], 0, tag["byte"], 2)
-        return get_int(data, 0)
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,23 @@
+import pytest
+
+from util.codecs import get_codec
+
+
+@pytest.mark.parametrize('type_name, value', [
+    ('Char', ''), ('Char', 'ab'), ('Char', '€'),
+    ('WChar', ''), ('WChar', 'abc'), ('WChar', '\U0001f600'),
+])
+def test_char_encoders_take_one_character(type_name, value):
+    codec = get_codec(type_name)
+    data = bytearray(codec.size + 4)
+    with pytest.raises(ValueError):
+        codec.encode(data, 0, value)
+    assert data == bytearray(codec.size + 4)
+
+
+def test_wchar_round_trip_stays_in_its_two_bytes():
+    codec = get_codec('WChar')
+    data = bytearray(4)
+    codec.encode(data, 1, 'é')
+    assert len(data) == 4
+    assert codec.decode(data, 1) == 'é'
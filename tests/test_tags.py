@@ -0,0 +1,26 @@
+import pytest
+
+from util.tags import changed, compile_tag
+
+
+def tag(tag_type, **fields):
+    return {'name': 'tag', 'type': tag_type, 'area': 'M', 'byte': 0, **fields}
+
+
+@pytest.mark.parametrize('tag_type', ['String[10]', 'Char', 'Date', 'Time', 'Date_And_Time'])
+def test_deadband_on_non_numeric_tag_is_rejected(tag_type):
+    with pytest.raises(ValueError):
+        compile_tag(tag(tag_type, deadband=1))
+    with pytest.raises(ValueError):
+        compile_tag(tag(tag_type, deadband_percent=5))
+
+
+def test_deadband_on_numeric_tag():
+    compiled = compile_tag(tag('Real', deadband=0.5))
+    assert compiled.deadband == (0.5, 0.0)
+    assert not changed(compiled, 10.4, 10.0)
+    assert changed(compiled, 10.6, 10.0)
+
+
+def test_non_numeric_tag_without_deadband_compiles():
+    assert compile_tag(tag('String[10]', deadband='')).deadband is None
@@ -0,0 +1,32 @@
+import pytest
+
+from util.tags import compile_tag
+from util.writer import WriteQueue, parse_value
+
+
+def tag(tag_type, byte=0):
+    return compile_tag({'name': 'tag', 'type': tag_type, 'area': 'M', 'byte': byte})
+
+
+def test_out_of_range_int_raises_value_error():
+    queue = WriteQueue()
+    int_tag = tag('Int')
+    with pytest.raises(ValueError):
+        queue.put(int_tag, parse_value(int_tag, "70000"))
+    assert len(queue) == 0
+
+
+def test_wrong_length_char_raises_value_error():
+    queue = WriteQueue()
+    char_tag = tag('Char')
+    with pytest.raises(ValueError):
+        queue.put(char_tag, parse_value(char_tag, "ab"))
+    assert len(queue) == 0
+
+
+def test_value_that_fits_is_queued():
+    queue = WriteQueue()
+    queue.put(tag('Int', 10), -2)
+    byte_values, bits, count = queue.take()
+    assert count == 1
+    assert list(byte_values.values()) == [{10: 0xFF, 11: 0xFE}]
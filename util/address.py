@@ -0,0 +1,101 @@
+'''One grammar for S7 logical addresses, with a memoized parser and a bulk parser
+
+Understands %I/%Q/%M with an optional X/B/W/D width (%I0.0, %IX0.0, %IB4,
+%IW80, %MD10) and DB addresses (%DB5.DBX2.3, %DB5.DBB2, %DB5.DBW2, %DB5.DBD2).
+The leading % is optional.'''
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from snap7.types import Areas
+
+# Same grammar as ADDRESS_PATTERN, in a form QRegularExpression accepts too
+ADDRESS_REGEX = (
+    r'^%?(?:(?P<area>[IQM])(?P<width>[XBWD]?)(?P<byte>\d{1,5})(?:\.(?P<bit>[0-7]))?'
+    r'|DB(?P<db>\d{1,5})\.DB(?P<db_width>[XBWD])(?P<db_byte>\d{1,5})(?:\.(?P<db_bit>[0-7]))?)$'
+)
+ADDRESS_PATTERN = re.compile(ADDRESS_REGEX)
+
+AREAS = {
+    'I': Areas.PE,
+    'Q': Areas.PA,
+    'M': Areas.MK,
+    'DB': Areas.DB,
+}
+# Letters the tag table stores for each area
+AREA_LETTERS = {area: letter for letter, area in AREAS.items()}
+
+# The type an address implies when nothing else is known
+WIDTH_TYPES = {
+    'X': 'Bool',
+    'B': 'Byte',
+    'W': 'Word',
+    'D': 'DWord',
+}
+
+Address = namedtuple('Address', 'area db_number byte bit width')
+
+
+class AddressError(ValueError):
+    '''An address that doesn't follow the grammar, with the line it came from when bulk parsing'''
+
+    def __init__(self, address, reason, line=None):
+        self.address = address
+        self.reason = reason
+        self.line = line
+        where = f"line {line}: " if line is not None else ""
+        super().__init__(f"{where}invalid address {address!r}: {reason}")
+
+
+@lru_cache(maxsize=65536)
+def parse_address(text):
+    '''Parses one logical address into an Address. Results are cached, so repeats cost a lookup.
+
+    Raises AddressError if the address is invalid.'''
+    match = ADDRESS_PATTERN.match(text.strip().upper())
+    if match is None:
+        raise AddressError(text, "not an I/Q/M or DB address")
+
+    area, width, byte, bit, db, db_width, db_byte, db_bit = match.groups()
+    if db is not None:
+        area, width, byte, bit, db_number = 'DB', db_width, db_byte, db_bit, int(db)
+        if db_number == 0:
+            raise AddressError(text, "DB numbers start at 1")
+    else:
+        db_number = 0
+        width = width or 'X'
+
+    if width == 'X' and bit is None:
+        raise AddressError(text, "bit addresses need a bit number, e.g. .0")
+    if width != 'X' and bit is not None:
+        raise AddressError(text, f"{WIDTH_TYPES[width]} addresses can't have a bit number")
+
+    return Address(AREAS[area], db_number, int(byte), int(bit) if bit is not None else None, width)
+
+
+def parse_addresses(lines):
+    '''Parses an iterable of addresses in one pass.
+
+    Returns (addresses, errors): addresses has an Address, or None for an
+    invalid line, per input line; errors has an AddressError per invalid line
+    with its 1-based line number.'''
+    addresses = []
+    errors = []
+    append = addresses.append
+    for line, text in enumerate(lines, start=1):
+        try:
+            append(parse_address(text))
+        except AddressError as e:
+            append(None)
+            errors.append(AddressError(text, e.reason, line))
+    return addresses, errors
+
+
+def address_fields(address):
+    '''Returns the tag dict fields of an address, the way the tag table stores them'''
+    return {
+        "area": AREA_LETTERS[address.area],
+        "db_number": str(address.db_number) if address.db_number else "",
+        "byte": str(address.byte),
+        "bit": str(address.bit) if address.bit is not None else "",
+    }
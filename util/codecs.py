@@ -0,0 +1,344 @@
+'''Table-driven codecs for the Siemens data types offered in the tag table
+
+Every codec has a fixed size, so the read planner can place any tag, including
+strings, arrays and structs, before a single byte has been read. Decoders take
+(data, offset) and encoders (data, offset, value), like the snap7.util getters
+and setters.'''
+import re
+import struct
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+# Strings without an explicit length hold the maximum of 254 characters
+DEFAULT_STRING_LENGTH = 254
+
+S7_DATE_EPOCH = date(1990, 1, 1)
+
+
+class Codec:
+    '''Size and decode/encode functions of one data type'''
+
+    __slots__ = ('name', 'size', 'decode', 'encode')
+
+    def __init__(self, name, size, decode, encode):
+        self.name = name
+        self.size = size
+        self.decode = decode
+        self.encode = encode
+
+    def __repr__(self):
+        return f"<Codec {self.name} size={self.size}>"
+
+
+def struct_codec(name, fmt, to_value=None, from_value=None):
+    '''Builds a codec around a struct format, optionally converting the raw number'''
+    packer = struct.Struct(fmt)
+    unpack_from = packer.unpack_from
+    pack_into = packer.pack_into
+
+    if to_value is None:
+        def decode(data, offset):
+            return unpack_from(data, offset)[0]
+
+        def encode(data, offset, value):
+            pack_into(data, offset, value)
+    else:
+        def decode(data, offset):
+            return to_value(unpack_from(data, offset)[0])
+
+        def encode(data, offset, value):
+            pack_into(data, offset, from_value(value))
+
+    return Codec(name, packer.size, decode, encode)
+
+
+def bool_codec(bit):
+    '''Builds the codec of one bit of a byte'''
+    mask = 1 << bit
+
+    def decode(data, offset):
+        return data[offset] & mask != 0
+
+    def encode(data, offset, value):
+        if value:
+            data[offset] |= mask
+        else:
+            data[offset] &= ~mask & 0xFF
+
+    return Codec('BOOL', 1, decode, encode)
+
+
+def milliseconds(value):
+    '''Converts a timedelta or a number of milliseconds to whole milliseconds'''
+    if isinstance(value, timedelta):
+        return round(value.total_seconds() * 1000)
+    return int(value)
+
+
+def nanoseconds(value):
+    '''Converts a timedelta or a number of nanoseconds to whole nanoseconds'''
+    if isinstance(value, timedelta):
+        return (value.days * 86400 + value.seconds) * 1_000_000_000 + value.microseconds * 1000
+    return int(value)
+
+
+def time_of_day(ms):
+    return (datetime.min + timedelta(milliseconds=ms)).time()
+
+
+def time_of_day_ms(value):
+    if isinstance(value, time):
+        return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000 + value.microsecond // 1000
+    return milliseconds(value)
+
+
+def date_days(value):
+    if isinstance(value, date):
+        return (value - S7_DATE_EPOCH).days
+    return int(value)
+
+
+def bcd(value):
+    return (value >> 4) * 10 + (value & 0x0F)
+
+
+def to_bcd(value):
+    return (value // 10) << 4 | value % 10
+
+
+def decode_date_and_time(data, offset):
+    '''Decodes the 8 byte BCD DATE_AND_TIME format'''
+    year = bcd(data[offset])
+    year += 1900 if year >= 90 else 2000
+    ms = bcd(data[offset + 6]) * 10 + (data[offset + 7] >> 4)
+    return datetime(
+        year, bcd(data[offset + 1]), bcd(data[offset + 2]),
+        bcd(data[offset + 3]), bcd(data[offset + 4]), bcd(data[offset + 5]), ms * 1000,
+    )
+
+
+def encode_date_and_time(data, offset, value):
+    ms = value.microsecond // 1000
+    # S7 numbers the days of the week from Sunday = 1
+    weekday = value.isoweekday() % 7 + 1
+    data[offset:offset + 8] = bytes([
+        to_bcd(value.year % 100), to_bcd(value.month), to_bcd(value.day),
+        to_bcd(value.hour), to_bcd(value.minute), to_bcd(value.second),
+        to_bcd(ms // 10), (ms % 10) << 4 | weekday,
+    ])
+
+
+def decode_char(data, offset):
+    return chr(data[offset])
+
+
+def encode_char(data, offset, value):
+    if len(value) != 1 or ord(value) > 0xFF:
+        raise ValueError(f"A Char holds one Latin-1 character, got {value!r}")
+    data[offset] = ord(value)
+
+
+def decode_wchar(data, offset):
+    return bytes(data[offset:offset + 2]).decode('utf-16-be')
+
+
+def encode_wchar(data, offset, value):
+    raw = value.encode('utf-16-be')
+    # Characters outside the BMP take a surrogate pair, which doesn't fit either
+    if len(value) != 1 or len(raw) != 2:
+        raise ValueError(f"A WChar holds one UTF-16 character, got {value!r}")
+    data[offset:offset + 2] = raw
+
+
+def string_codec(length):
+    '''Builds the codec of a STRING[length]: max length byte, actual length byte, characters'''
+
+    def decode(data, offset):
+        actual = min(data[offset + 1], length)
+        return bytes(data[offset + 2:offset + 2 + actual]).decode('latin-1')
+
+    def encode(data, offset, value):
+        raw = value.encode('latin-1')[:length]
+        data[offset] = length
+        data[offset + 1] = len(raw)
+        data[offset + 2:offset + 2 + len(raw)] = raw
+
+    return Codec(f'STRING[{length}]', length + 2, decode, encode)
+
+
+def wstring_codec(length):
+    '''Builds the codec of a WSTRING[length]: max length word, actual length word, UTF-16 characters'''
+    header = struct.Struct('>HH')
+
+    def decode(data, offset):
+        actual = min(header.unpack_from(data, offset)[1], length)
+        return bytes(data[offset + 4:offset + 4 + actual * 2]).decode('utf-16-be')
+
+    def encode(data, offset, value):
+        raw = value.encode('utf-16-be')[:length * 2]
+        header.pack_into(data, offset, length, len(raw) // 2)
+        data[offset + 4:offset + 4 + len(raw)] = raw
+
+    return Codec(f'WSTRING[{length}]', length * 2 + 4, decode, encode)
+
+
+def array_codec(name, low, high, element):
+    '''Builds the codec of an array that is read as one contiguous span'''
+    count = high - low + 1
+    if count <= 0:
+        raise ValueError(f"Array bounds must be ascending, got {low}..{high}")
+
+    if element.name == 'BOOL':
+        # Bool arrays are packed eight to a byte, starting at bit 0
+        def decode(data, offset):
+            return [data[offset + i // 8] >> (i % 8) & 1 != 0 for i in range(count)]
+
+        def encode(data, offset, values):
+            for i, value in enumerate(values):
+                BOOL_CODECS[i % 8].encode(data, offset + i // 8, value)
+
+        return Codec(name, (count + 7) // 8, decode, encode)
+
+    stride = element.size
+    element_decode = element.decode
+    element_encode = element.encode
+
+    def decode(data, offset):
+        return [element_decode(data, offset + i * stride) for i in range(count)]
+
+    def encode(data, offset, values):
+        for i, value in enumerate(values):
+            element_encode(data, offset + i * stride, value)
+
+    return Codec(name, count * stride, decode, encode)
+
+
+def struct_layout_codec(name, members):
+    '''Builds the codec of a struct, placing members like a standard (non-optimized) DB does.
+
+    Bools are packed into consecutive bits, anything else starts on a new byte,
+    and members longer than a byte start on an even byte. The whole struct
+    takes up an even number of bytes.'''
+    layout = []
+    position = 0
+    bit = 0
+    for member in members:
+        if member.name == 'BOOL':
+            if bit == 8:
+                position += 1
+                bit = 0
+            layout.append((position, BOOL_CODECS[bit]))
+            bit += 1
+            continue
+        if bit:
+            position += 1
+            bit = 0
+        if member.size > 1:
+            position += position & 1
+        layout.append((position, member))
+        position += member.size
+    if bit:
+        position += 1
+    size = position + (position & 1)
+
+    def decode(data, offset):
+        return tuple(member.decode(data, offset + position) for position, member in layout)
+
+    def encode(data, offset, values):
+        for (position, member), value in zip(layout, values):
+            member.encode(data, offset + position, value)
+
+    return Codec(name, size, decode, encode)
+
+
+# Bool codecs are bound to a bit, one per bit of a byte
+BOOL_CODECS = [bool_codec(bit) for bit in range(8)]
+
+# Every fixed-size type of the tag table, keyed by its upper-case name
+CODECS = {codec.name: codec for codec in (
+    struct_codec('BYTE', '>B'),
+    struct_codec('WORD', '>H'),
+    struct_codec('DWORD', '>I'),
+    struct_codec('LWORD', '>Q'),
+    struct_codec('SINT', '>b'),
+    struct_codec('INT', '>h'),
+    struct_codec('DINT', '>i'),
+    struct_codec('LINT', '>q'),
+    struct_codec('USINT', '>B'),
+    struct_codec('UINT', '>H'),
+    struct_codec('UDINT', '>I'),
+    struct_codec('ULINT', '>Q'),
+    struct_codec('REAL', '>f'),
+    struct_codec('LREAL', '>d'),
+    struct_codec('TIME', '>i', lambda ms: timedelta(milliseconds=ms), milliseconds),
+    struct_codec('LTIME', '>q', lambda ns: timedelta(microseconds=ns // 1000), nanoseconds),
+    struct_codec('DATE', '>H', lambda days: S7_DATE_EPOCH + timedelta(days=days), date_days),
+    struct_codec('TIME_OF_DAY', '>I', time_of_day, time_of_day_ms),
+    Codec('DATE_AND_TIME', 8, decode_date_and_time, encode_date_and_time),
+    Codec('CHAR', 1, decode_char, encode_char),
+    Codec('WCHAR', 2, decode_wchar, encode_wchar),
+)}
+CODECS['BOOL'] = BOOL_CODECS[0]
+
+STRING_PATTERN = re.compile(r'^(W?STRING)\s*(?:\[\s*(\d+)\s*\])?$')
+ARRAY_PATTERN = re.compile(r'^ARRAY\s*\[\s*(-?\d+)\s*\.\.\s*(-?\d+)\s*\]\s+OF\s+(.+)$')
+STRUCT_PATTERN = re.compile(r'^STRUCT\s*\((.*)\)$')
+
+
+def split_members(members):
+    '''Splits the member list of a struct on commas that aren't nested in brackets'''
+    parts = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(members):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(members[start:i])
+            start = i + 1
+    parts.append(members[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+@lru_cache(maxsize=None)
+def get_codec(type_name):
+    '''Returns the codec of a data type name from the tag table.
+
+    Besides the plain types, this understands "String[n]", "WString[n]",
+    "Array[low..high] of <type>" and "Struct(<type>, <type>, ...)".
+    Raises ValueError for anything else.'''
+    name = ' '.join(type_name.upper().split())
+    if name in CODECS:
+        return CODECS[name]
+
+    match = STRING_PATTERN.match(name)
+    if match:
+        kind, length = match.groups()
+        length = int(length) if length else DEFAULT_STRING_LENGTH
+        if kind == 'STRING':
+            if not 0 < length <= 254:
+                raise ValueError(f"String length must be between 1 and 254, got {length}")
+            return string_codec(length)
+        if not 0 < length <= 16382:
+            raise ValueError(f"WString length must be between 1 and 16382, got {length}")
+        return wstring_codec(length)
+
+    match = ARRAY_PATTERN.match(name)
+    if match:
+        low, high, element = match.groups()
+        return array_codec(name, int(low), int(high), get_codec(element))
+
+    match = STRUCT_PATTERN.match(name)
+    if match:
+        members = [get_codec(member) for member in split_members(match.group(1))]
+        if not members:
+            raise ValueError("Struct needs at least one member type")
+        return struct_layout_codec(name, members)
+
+    if name == 'ARRAY':
+        raise ValueError("Array needs its bounds and element type, e.g. Array[0..9] of Int")
+    if name == 'STRUCT':
+        raise ValueError("Struct needs its member types, e.g. Struct(Int, Real, Bool)")
+    raise ValueError(f"Unsupported tag type: {type_name}")
@@ -0,0 +1,156 @@
+'''Shared, self-healing PLC connections with reconnect backoff'''
+import random
+import threading
+import time
+
+import snap7
+
+# Reconnect delays grow from MIN_BACKOFF, doubling per failed attempt, up to MAX_BACKOFF seconds
+MIN_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+DISCONNECTED = 'disconnected'
+CONNECTED = 'connected'
+BACKING_OFF = 'backing off'
+
+# snap7 prefixes errors of the transport layers with these; after one the socket is gone
+LINK_ERRORS = ('TCP', 'ISO')
+
+
+class LinkDownError(ConnectionError):
+    '''Raised when a connection is down and waiting for its next reconnect attempt'''
+
+
+class Connection:
+    '''One snap7 client per endpoint that reconnects itself when the link drops.
+
+    Calls are serialized with a lock because a snap7 client can't be used from
+    two threads at once, so any number of consumers can share a connection.'''
+
+    def __init__(self, ip_address, rack, slot, tcpport=102, min_backoff=MIN_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.ip_address = ip_address
+        self.rack = rack
+        self.slot = slot
+        self.tcpport = tcpport
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.RLock()
+        self.client = None
+        self.state = DISCONNECTED
+        self.connects = 0
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_error = None
+        # PDU length negotiated by the last connect, None before the first one
+        self.pdu_length = None
+
+    def __repr__(self):
+        return f"<Connection {self.ip_address}:{self.tcpport} rack={self.rack} slot={self.slot} {self.state}>"
+
+    @property
+    def connected(self):
+        return self.state == CONNECTED
+
+    @property
+    def reconnects(self):
+        '''Number of times the link was re-established after the first connect'''
+        return max(self.connects - 1, 0)
+
+    def backoff(self):
+        '''Returns the delay before the next attempt: exponential, with jitter so PLCs don't reconnect in lockstep'''
+        delay = min(self.max_backoff, self.min_backoff * 2 ** (self.failures - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def ensure(self):
+        '''Returns a connected client, connecting first if needed.
+
+        Raises LinkDownError while backing off, or the snap7 error of a failed attempt.'''
+        with self.lock:
+            if self.client is not None:
+                return self.client
+            if time.monotonic() < self.next_attempt:
+                raise LinkDownError(f"{self.ip_address} is down: {self.last_error}")
+
+            client = snap7.client.Client()
+            try:
+                client.connect(self.ip_address, self.rack, self.slot, self.tcpport)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = e
+                self.state = BACKING_OFF
+                self.next_attempt = time.monotonic() + self.backoff()
+                raise
+
+            self.client = client
+            self.pdu_length = client.get_pdu_length()
+            self.connects += 1
+            self.failures = 0
+            self.last_error = None
+            self.state = CONNECTED
+            return client
+
+    def call(self, func, *args):
+        '''Runs func(client, *args) on the connected client and drops the client if the link died'''
+        with self.lock:
+            client = self.ensure()
+            try:
+                return func(client, *args)
+            except Exception as e:
+                if any(error in str(e) for error in LINK_ERRORS) or not client.get_connected():
+                    self.drop(e)
+                raise
+
+    def drop(self, error=None):
+        '''Throws away a dead client; the next call reconnects right away'''
+        with self.lock:
+            if self.client is not None:
+                try:
+                    self.client.disconnect()
+                except Exception:
+                    pass
+                self.client = None
+            self.last_error = error
+            self.state = DISCONNECTED
+            self.next_attempt = 0.0
+
+    def close(self):
+        self.drop()
+
+    def status(self):
+        '''Returns the link state as a dict of plain values'''
+        return {
+            'ip_address': self.ip_address,
+            'state': self.state,
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+            'pdu_length': self.pdu_length,
+            'last_error': str(self.last_error) if self.last_error else None,
+        }
+
+
+class ConnectionPool:
+    '''Hands out one shared Connection per endpoint'''
+
+    def __init__(self, min_backoff=MIN_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.connections = {}
+
+    def get(self, ip_address, rack, slot, tcpport=102):
+        key = (ip_address, rack, slot, tcpport)
+        with self.lock:
+            connection = self.connections.get(key)
+            if connection is None:
+                connection = Connection(ip_address, rack, slot, tcpport, self.min_backoff, self.max_backoff)
+                self.connections[key] = connection
+            return connection
+
+    def status(self):
+        with self.lock:
+            return [connection.status() for connection in self.connections.values()]
+
+    def close_all(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
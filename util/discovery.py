@@ -0,0 +1,116 @@
+'''Finds S7 PLCs on a subnet: a concurrent port 102 sweep, then CPU info from every responder
+
+The sweep opens plain TCP connections with asyncio, a bounded number at a
+time, so a /22 takes a few seconds. Responders are then connected with snap7
+on the usual rack/slot pairs, in a thread pool, to read their CPU info and
+order code.'''
+import asyncio
+import ipaddress
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import snap7
+
+S7_PORT = 102
+DEFAULT_CONCURRENCY = 256
+# Seconds to wait for a TCP connect; PLCs on the local network answer in milliseconds
+DEFAULT_TIMEOUT = 0.5
+# Rack/slot pairs to try, in order: S7-1200/1500, S7-300, S7-400, ET 200SP/LOGO!
+COMMON_RACK_SLOTS = [(0, 1), (0, 2), (0, 3), (0, 0)]
+# Receive timeout of the snap7 probes, in ms
+PROBE_RECV_TIMEOUT = 1000
+MAX_IDENTIFY_WORKERS = 16
+
+PlcInfo = namedtuple('PlcInfo', 'ip_address rack slot module_type module_name serial_number as_name order_code firmware')
+
+
+def hosts(cidr):
+    '''Returns the host addresses of a network like "192.168.0.0/24"; a plain address is a network of one'''
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+    if network.num_addresses == 1:
+        return [str(network.network_address)]
+    return [str(host) for host in network.hosts()]
+
+
+async def port_open(ip_address, port=S7_PORT, timeout=DEFAULT_TIMEOUT):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def sweep(cidr, port=S7_PORT, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+    '''Returns the addresses of a network that accept connections on port, in address order'''
+    semaphore = asyncio.Semaphore(concurrency)
+    addresses = hosts(cidr)
+
+    async def probe(ip_address):
+        async with semaphore:
+            return await port_open(ip_address, port, timeout)
+
+    found = await asyncio.gather(*(probe(ip_address) for ip_address in addresses))
+    return [ip_address for ip_address, is_open in zip(addresses, found) if is_open]
+
+
+def text(value):
+    return value.decode(errors='replace').strip('\x00 ')
+
+
+def identify(ip_address, port=S7_PORT, rack_slots=COMMON_RACK_SLOTS):
+    '''Connects on the first rack/slot pair that works and reads the CPU info.
+
+    Returns a PlcInfo, with empty fields for what the CPU refuses to tell
+    (S7-1200/1500 without PUT/GET access, for example), or None if no pair
+    connects.'''
+    for rack, slot in rack_slots:
+        client = snap7.client.Client()
+        client.set_param(snap7.types.RecvTimeout, PROBE_RECV_TIMEOUT)
+        try:
+            client.connect(ip_address, rack, slot, port)
+        except RuntimeError:
+            continue
+        try:
+            fields = dict.fromkeys(PlcInfo._fields, "")
+            try:
+                info = client.get_cpu_info()
+                fields.update(module_type=text(info.ModuleTypeName), module_name=text(info.ModuleName),
+                              serial_number=text(info.SerialNumber), as_name=text(info.ASName))
+            except RuntimeError:
+                pass
+            try:
+                order_code = client.get_order_code()
+                fields.update(order_code=text(order_code.OrderCode),
+                              firmware=f"V{order_code.V1}.{order_code.V2}.{order_code.V3}")
+            except RuntimeError:
+                pass
+            fields.update(ip_address=ip_address, rack=rack, slot=slot)
+            return PlcInfo(**fields)
+        finally:
+            client.disconnect()
+    return None
+
+
+async def discover(cidr, port=S7_PORT, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                   rack_slots=COMMON_RACK_SLOTS, on_found=None):
+    '''Sweeps a network and identifies every responder. Returns PlcInfos in address order.
+
+    on_found(info) is called as soon as each PLC is identified, from the event loop.'''
+    responders = await sweep(cidr, port, concurrency, timeout)
+    if not responders:
+        return []
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=min(MAX_IDENTIFY_WORKERS, len(responders))) as executor:
+        async def identify_one(ip_address):
+            info = await loop.run_in_executor(executor, identify, ip_address, port, rack_slots)
+            if info is not None and on_found is not None:
+                on_found(info)
+            return info
+
+        found = await asyncio.gather(*(identify_one(ip_address) for ip_address in responders))
+    return [info for info in found if info is not None]
@@ -0,0 +1,146 @@
+'''Dialog that sweeps a subnet for PLCs and lets the user pick one'''
+import asyncio
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import (QDialog, QDialogButtonBox, QHBoxLayout, QLabel, QLineEdit, QPushButton, QTableWidget,
+                             QTableWidgetItem, QVBoxLayout)
+
+from util.discovery import PlcInfo, discover, hosts
+
+COLUMNS = [("IP", "ip_address"), ("Rack", "rack"), ("Slot", "slot"), ("CPU", "module_type"),
+           ("Name", "as_name"), ("Order Code", "order_code"), ("Firmware", "firmware")]
+# How often a running scan checks whether it was asked to stop, in seconds
+INTERRUPT_POLL = 0.1
+
+
+class DiscoveryWorker(QThread):
+    '''Runs discover() on its own event loop and reports PLCs as they are identified'''
+
+    found_signal = pyqtSignal(tuple)
+    finished_signal = pyqtSignal(int)
+    error_signal = pyqtSignal(str)
+    # Workers of closed dialogs, kept alive until their scan has wound down
+    retired = set()
+
+    def __init__(self, cidr, port):
+        super().__init__()
+        self.cidr = cidr
+        self.port = port
+
+    def run(self):
+        try:
+            found = asyncio.run(self.discover())
+        except asyncio.CancelledError:
+            return
+        except (OSError, ValueError) as e:
+            self.error_signal.emit(str(e))
+            return
+        self.finished_signal.emit(len(found))
+
+    async def discover(self):
+        '''Runs discover() until it is done or requestInterruption() cancels it'''
+        scan = asyncio.create_task(discover(self.cidr, self.port, on_found=self.found_signal.emit))
+        while not scan.done():
+            if self.isInterruptionRequested():
+                scan.cancel()
+            await asyncio.wait([scan], timeout=INTERRUPT_POLL)
+        return scan.result()
+
+    def retire(self):
+        '''Stops the scan without waiting for it and reports nothing more.
+
+        Cancelling the sweep is immediate, but a PLC being identified keeps its
+        thread until the snap7 connect times out, so the worker winds down in
+        the background.'''
+        self.requestInterruption()
+        for signal in (self.found_signal, self.finished_signal, self.error_signal):
+            signal.disconnect()
+        DiscoveryWorker.retired.add(self)
+        self.finished.connect(self.forget)
+        if self.isFinished():
+            self.forget()
+
+    def forget(self):
+        self.wait()
+        DiscoveryWorker.retired.discard(self)
+
+
+class DiscoveryDialog(QDialog):
+    '''Scans a CIDR range; selected() returns the PlcInfo of the chosen row'''
+
+    def __init__(self, cidr="", port=102, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Find PLCs")
+        self.port = port
+        self.found = []
+        self.worker = None
+
+        layout = QVBoxLayout(self)
+        input_layout = QHBoxLayout()
+        input_layout.addWidget(QLabel("Network:"))
+        self.cidr_input = QLineEdit(cidr)
+        self.cidr_input.setPlaceholderText("192.168.0.0/24")
+        input_layout.addWidget(self.cidr_input)
+        self.scan_button = QPushButton("Scan")
+        self.scan_button.clicked.connect(self.scan)
+        input_layout.addWidget(self.scan_button)
+        layout.addLayout(input_layout)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels([label for label, _ in COLUMNS])
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setSelectionMode(QTableWidget.SingleSelection)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.doubleClicked.connect(self.accept)
+        layout.addWidget(self.table)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+    def scan(self):
+        cidr = self.cidr_input.text()
+        try:
+            count = len(hosts(cidr))
+        except ValueError as e:
+            self.status_label.setText(str(e))
+            return
+        self.found = []
+        self.table.setRowCount(0)
+        self.scan_button.setEnabled(False)
+        self.status_label.setText(f"Scanning {count} addresses...")
+        self.worker = DiscoveryWorker(cidr, self.port)
+        self.worker.found_signal.connect(self.add_plc)
+        self.worker.finished_signal.connect(self.scan_finished)
+        self.worker.error_signal.connect(self.scan_failed)
+        self.worker.start()
+
+    def add_plc(self, info):
+        info = PlcInfo(*info)
+        self.found.append(info)
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        for column, (_, key) in enumerate(COLUMNS):
+            self.table.setItem(row, column, QTableWidgetItem(str(getattr(info, key))))
+        self.table.resizeColumnsToContents()
+
+    def scan_finished(self, count):
+        self.scan_button.setEnabled(True)
+        self.status_label.setText(f"Found {count} PLC{'s' if count != 1 else ''}")
+
+    def scan_failed(self, message):
+        self.scan_button.setEnabled(True)
+        self.status_label.setText(f"Scan failed: {message}")
+
+    def selected(self):
+        rows = self.table.selectionModel().selectedRows()
+        return self.found[rows[0].row()] if rows else None
+
+    def done(self, result):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.retire()
+        super().done(result)
@@ -0,0 +1,185 @@
+'''Raw snapshots of whole memory areas, and byte/bit level diffs between them
+
+dump_area reads a complete area or DB in PDU-sized chunks, spread over
+several connections so that requests are in flight at the same time, and
+writes it straight into a memory-mapped snapshot file. diff_snapshots
+compares two snapshots with NumPy and reports every changed byte with the
+bits that flipped; decode_tags and decode_as turn those changes back into
+values with the codec table.
+
+A snapshot file is a header line of JSON padded to HEADER_SIZE bytes,
+followed by the raw bytes of the area.'''
+import json
+import mmap
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import snap7
+
+from util.address import AREA_LETTERS, AREAS
+from util.codecs import get_codec
+from util.planner import DEFAULT_PDU_LENGTH, max_block_size
+
+HEADER_SIZE = 512
+MAGIC = "S7SNAP1"
+# S7 requests address bits with 24 bits, so no area can be larger than this
+MAX_PROBE_SIZE = 1 << 21
+DEFAULT_CONNECTIONS = 3
+SNAPSHOT_EXTENSION = ".snap"
+
+
+def snapshot_name(area, db_number=0):
+    '''File name of the snapshot of an area, e.g. M.snap or DB5.snap'''
+    letter = AREA_LETTERS[area]
+    return f"{letter}{db_number if letter == 'DB' else ''}{SNAPSHOT_EXTENSION}"
+
+
+def probe_size(plc, area, db_number=0, limit=MAX_PROBE_SIZE):
+    '''Finds the size of an area or DB by binary search on one-byte reads'''
+    if not readable(plc, area, db_number, 0):
+        return 0
+    low, high = 1, limit  # low bytes are known to exist, high is known not to (or the limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if readable(plc, area, db_number, middle - 1):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def readable(plc, area, db_number, offset):
+    try:
+        plc.read_area(area, db_number, offset, 1)
+        return True
+    except RuntimeError:
+        return False
+
+
+def chunks(size, pdu_length=DEFAULT_PDU_LENGTH):
+    '''Splits size bytes into (start, length) pieces that each fit in one response'''
+    step = max_block_size(pdu_length)
+    return [(start, min(step, size - start)) for start in range(0, size, step)]
+
+
+def create_snapshot(path, size, **header):
+    '''Creates a snapshot file of size bytes and returns it memory-mapped for writing'''
+    text = json.dumps({"magic": MAGIC, "size": size, **header})
+    if len(text) >= HEADER_SIZE:
+        raise ValueError("Snapshot header too long")
+    with open(path, "wb") as f:
+        f.write(text.encode().ljust(HEADER_SIZE - 1) + b"\n")
+        f.truncate(HEADER_SIZE + size)
+    with open(path, "r+b") as f:
+        return mmap.mmap(f.fileno(), 0)
+
+
+def open_snapshot(path):
+    '''Returns (header dict, read-only uint8 array of the area) of a snapshot; the array is memory-mapped'''
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+    if header.get("magic") != MAGIC:
+        raise ValueError(f"{path} is not a snapshot")
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_SIZE, shape=(header["size"],)) \
+        if header["size"] else np.empty(0, np.uint8)
+    return header, data
+
+
+def dump_area(clients, area, db_number, size, path, pdu_length=DEFAULT_PDU_LENGTH, **header):
+    '''Reads size bytes of an area into a new snapshot file and returns the seconds it took.
+
+    The chunks are shared out over the connected clients, which read at the
+    same time; every chunk is copied straight into the memory-mapped file.'''
+    area_header = {"area": AREA_LETTERS[area], "db_number": db_number, "time": time.time(), **header}
+    snapshot = create_snapshot(path, size, **area_header)
+    pieces = chunks(size, pdu_length)
+    started = time.perf_counter()
+
+    def read(n):
+        plc = clients[n]
+        for start, length in pieces[n::len(clients)]:
+            offset = HEADER_SIZE + start
+            snapshot[offset:offset + length] = plc.read_area(area, db_number, start, length)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+            list(executor.map(read, range(len(clients))))
+        snapshot.flush()
+    finally:
+        snapshot.close()
+    return time.perf_counter() - started
+
+
+def connect_clients(ip_address, rack, slot, count=DEFAULT_CONNECTIONS, tcpport=102):
+    '''Opens count connections to a PLC; CPUs limit how many they accept, so keep it small'''
+    clients = []
+    for _ in range(count):
+        plc = snap7.client.Client()
+        plc.connect(ip_address, rack, slot, tcpport)
+        clients.append(plc)
+    return clients
+
+
+def diff_snapshots(old, new):
+    '''Compares two byte arrays and returns (offsets, old bytes, new bytes, flipped bits) of every changed byte.
+
+    Arrays of different lengths are compared over the shorter one.'''
+    size = min(len(old), len(new))
+    old, new = old[:size], new[:size]
+    offsets = np.flatnonzero(old != new)
+    old_bytes = np.asarray(old[offsets])
+    new_bytes = np.asarray(new[offsets])
+    return offsets, old_bytes, new_bytes, old_bytes ^ new_bytes
+
+
+def bit_changes(offsets, flipped, new_bytes):
+    '''Returns (byte, bit, new state) arrays of every flipped bit'''
+    bits = np.unpackbits(flipped[:, None], axis=1, bitorder='little')
+    rows, positions = np.nonzero(bits)
+    states = (new_bytes[rows] >> positions) & 1
+    return offsets[rows], positions, states.astype(bool)
+
+
+def decode_tags(compiled, old, new, offsets):
+    '''Returns (tag, old value, new value) for every compiled tag whose value changed.
+
+    compiled tags outside the snapshot's area are the caller's to filter out.'''
+    tags = [tag for tag in compiled if tag is not None]
+    if not tags or not len(offsets):
+        return []
+    starts = np.array([tag.byte for tag in tags])
+    ends = starts + np.array([tag.size for tag in tags])
+    # A tag may have changed if a changed offset lies in [start, end)
+    touched = np.searchsorted(offsets, ends) > np.searchsorted(offsets, starts)
+    # The decoders read straight from the (memory-mapped) snapshots instead of copies of them
+    old_view, new_view = memoryview(old), memoryview(new)
+    size = min(len(old_view), len(new_view))
+    changes = []
+    for tag, hit in zip(tags, touched):
+        if hit and tag.byte + tag.size <= size:
+            before, after = tag.decode(old_view, tag.byte), tag.decode(new_view, tag.byte)
+            # A Bool covers its whole byte, but only its own bit counts
+            if before != after:
+                changes.append((tag, before, after))
+    return changes
+
+
+def decode_as(type_name, old, new, offsets):
+    '''Decodes the changed bytes as a type: returns (offset, old value, new value) per aligned slot that changed'''
+    codec = get_codec(type_name.upper())
+    slots = np.unique(offsets // codec.size * codec.size).tolist()
+    old_view, new_view = memoryview(old), memoryview(new)
+    size = min(len(old_view), len(new_view))
+    return [(slot, codec.decode(old_view, slot), codec.decode(new_view, slot))
+            for slot in slots if slot + codec.size <= size]
+
+
+def parse_area(text):
+    '''Turns I, Q, M, DB or DB<n> into (area, db_number)'''
+    text = text.upper()
+    if text.startswith("DB") and text[2:].isdigit():
+        return AREAS["DB"], int(text[2:])
+    if text not in AREAS or text == "DB":
+        raise ValueError(f"Unknown area {text!r}, use I, Q, M or DB<number>")
+    return AREAS[text], 0
@@ -0,0 +1,437 @@
+'''Asyncio acquisition engine that polls many PLCs concurrently from one process'''
+import asyncio
+import functools
+import heapq
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from util.connection import CONNECTED, ConnectionPool, LinkDownError
+from util.planner import DEFAULT_PDU_LENGTH, MIN_PDU_LENGTH, ReadBuffers, ShortReadError, plan_reads
+from util.tags import changed, compile_tags, tag_spans
+from util.writer import WriteQueue
+
+DEFAULT_SCAN_PERIOD = 0.1
+# Periods in seconds of the scan classes tags can ask for with a "scan_class" key
+SCAN_CLASSES = {
+    'fast': 0.02,
+    'normal': DEFAULT_SCAN_PERIOD,
+    'slow': 1.0,
+}
+DEFAULT_SCAN_CLASS = 'normal'
+# Request errors that suggest the requests are too big for the CPU or the link
+SIZE_ERRORS = ('timed out', 'Timeout', 'Size over PDU')
+# Good scans with requests planned below the negotiated PDU before trying twice the size
+RECOVERY_SCANS = 100
+# Seconds between warnings about a scan class that keeps missing its period; scan_summary() has the counts
+OVERRUN_LOG_INTERVAL = 60.0
+# snap7 calls block, so they run on a bounded pool of threads shared by all PLCs
+DEFAULT_MAX_WORKERS = 16
+
+log = logging.getLogger(__name__)
+
+# Stands in for the last published value of a tag that hasn't been published yet
+UNPUBLISHED = object()
+
+
+@functools.cache
+def vector_decoder_class():
+    '''Returns util.vector.VectorDecoder, or None without NumPy.
+
+    NumPy takes longer to import than the rest of the engine, so it is only
+    imported when the first poller plans its reads.'''
+    try:
+        from util.vector import VectorDecoder
+    except ImportError:  # NumPy is optional, without it tags are decoded one by one
+        return None
+    return VectorDecoder
+
+
+class ScanResult:
+    '''Values read from one PLC in one scan'''
+
+    __slots__ = ('ip_address', 'timestamp', 'connected', 'values')
+
+    def __init__(self, ip_address, timestamp, connected, values):
+        self.ip_address = ip_address
+        self.timestamp = timestamp
+        self.connected = connected
+        # (tag index in the engine's tag list, value)
+        self.values = values
+
+    def __repr__(self):
+        return f"<ScanResult {self.ip_address} connected={self.connected} values={len(self.values)}>"
+
+
+class PlcPoller:
+    '''Reads one scan class of the tags of one PLC over a shared connection, with its own scan period'''
+
+    def __init__(self, connection, tags, indices, scan_period=DEFAULT_SCAN_PERIOD, change_only=True,
+                 scan_class=DEFAULT_SCAN_CLASS, metrics=None):
+        self.connection = connection
+        self.ip_address = connection.ip_address
+        self.scan_period = scan_period
+        self.scan_class = scan_class
+        # Scans done, deadlines missed because a scan ended after the next one was due, last scan time
+        self.scans = 0
+        self.overruns = 0
+        self.last_duration = 0.0
+        self.late = False
+        self.overrun_log_at = 0.0
+        # Index of each of our tags in the tag list the engine was given
+        self.indices = indices
+        self.compiled = compile_tags(tags)
+        self.values = [None] * len(self.compiled)
+        # With change_only, a scan only reports tags whose value moved past their deadband
+        self.change_only = change_only
+        self.published = [UNPUBLISHED] * len(self.compiled)
+        # Requests are planned for the PDU the connection negotiates, capped by pdu_limit after size errors
+        self.pdu_limit = None
+        self.good_scans = 0
+        self.plan(DEFAULT_PDU_LENGTH)
+        self.instrument(metrics)
+
+    def plan(self, pdu_length):
+        '''Plans the requests for a PDU length. The blocks change, so change detection starts over.'''
+        self.pdu_length = pdu_length
+        self.requests = plan_reads(tag_spans(self.compiled), pdu_length=pdu_length)
+        VectorDecoder = vector_decoder_class()
+        self.decoder = VectorDecoder(self.compiled, self.requests) if VectorDecoder is not None else None
+        self.buffers = ReadBuffers(self.requests)
+        # Blocks the PLC refused in their last read, so each failure is only logged when it starts
+        self.failed_blocks = set()
+
+    def shrink(self, error):
+        '''Halves the size requests are planned for, after an error that suggests they are too big'''
+        if self.pdu_length <= MIN_PDU_LENGTH:
+            return
+        self.pdu_limit = max(MIN_PDU_LENGTH, self.pdu_length // 2)
+        self.good_scans = 0
+        log.warning("Reading from %s failed (%s), using %d byte requests for a while", self.ip_address, error, self.pdu_limit)
+
+    def grow(self):
+        '''Doubles the size requests are planned for, back up to the negotiated PDU'''
+        self.good_scans = 0
+        self.pdu_limit *= 2
+        if self.pdu_limit >= (self.connection.pdu_length or DEFAULT_PDU_LENGTH):
+            self.pdu_limit = None
+
+    def instrument(self, metrics):
+        '''Starts timing requests and decoding into metrics, or stops with None.
+
+        Untimed scans call the plain functions, so switching off costs nothing.'''
+        if metrics is None:
+            self.read_request = self.read_into
+            self.decode_block = self.decode
+            return
+
+        round_trip = metrics.histogram("request round trip")
+        request_bytes = metrics.histogram("request size", "B")
+        decode_time = metrics.histogram("decode")
+        read_into = self.read_into
+        decode = self.decode
+        perf_counter = time.perf_counter
+
+        def timed_read_request(client, n):
+            start = perf_counter()
+            buffers = read_into(client, n)
+            end = perf_counter()
+            round_trip.record(end - start, end)
+            request_bytes.record(sum(block.size for block in self.requests[n]), end)
+            return buffers
+
+        def timed_decode(block, data):
+            start = perf_counter()
+            decode(block, data)
+            end = perf_counter()
+            decode_time.record(end - start, end)
+
+        self.read_request = timed_read_request
+        self.decode_block = timed_decode
+
+    def read_into(self, client, n):
+        '''Reads request number n into its preallocated buffers and returns them'''
+        return self.buffers.read(client, n)
+
+    def decode(self, block, data):
+        '''Decodes every tag of a block into self.values'''
+        if self.decoder is not None:
+            self.decoder.decode_into(block, data, self.values)
+        else:
+            for i, offset in block.members:
+                self.values[i] = self.compiled[i].decode(data, offset)
+
+    def scan(self):
+        '''Runs every planned request once and returns (engine tag index, value) pairs'''
+        return self.connection.call(self.read)
+
+    def read(self, client):
+        pdu_length = self.connection.pdu_length or DEFAULT_PDU_LENGTH
+        if self.pdu_limit is not None:
+            pdu_length = min(pdu_length, self.pdu_limit)
+        if pdu_length != self.pdu_length:
+            self.plan(pdu_length)
+
+        try:
+            scanned = self.read_requests(client)
+        except Exception as e:
+            if isinstance(e, ShortReadError) or any(text in str(e) for text in SIZE_ERRORS):
+                self.shrink(e)
+            raise
+
+        if self.pdu_limit is not None:
+            self.good_scans += 1
+            if self.good_scans >= RECOVERY_SCANS:
+                self.grow()
+        return scanned
+
+    def read_requests(self, client):
+        values = self.values
+        indices = self.indices
+        buffers = self.buffers
+        scanned = []
+        # Tags that changed; only published once the whole scan succeeded, so a scan that fails
+        # halfway doesn't mark values as published that were never reported
+        moved = []
+        for n, request in enumerate(self.requests):
+            data = self.read_request(client, n)
+            for j, block in enumerate(request):
+                if buffers.ok(n, j):
+                    # A block whose bytes didn't change can't hold a changed tag
+                    if self.change_only and buffers.unchanged(n, j):
+                        continue
+                    self.failed_blocks.discard(block)
+                    self.decode_block(block, data[j])
+                else:
+                    # The tags of a block the PLC refused read as None; the other blocks are still used
+                    if block not in self.failed_blocks:
+                        self.failed_blocks.add(block)
+                        log.warning("Reading %r from %s failed: %s", block, self.ip_address, buffers.errors[n][j])
+                    for i, _ in block.members:
+                        values[i] = None
+
+                if not self.change_only:
+                    scanned.extend((indices[i], values[i]) for i, _ in block.members)
+                    continue
+                compiled = self.compiled
+                published = self.published
+                for i, _ in block.members:
+                    last = published[i]
+                    if last is UNPUBLISHED or changed(compiled[i], values[i], last):
+                        moved.append(i)
+        # Only a complete scan becomes the one the next scan is compared with
+        buffers.swap()
+        published = self.published
+        for i in moved:
+            value = values[i]
+            published[i] = value
+            scanned.append((indices[i], value))
+        return scanned
+
+    def finish_scan(self, deadline, started, finished, read=True):
+        '''Books a scan that was due at deadline and returns the deadline of the next one.
+
+        A scan that ends after the next deadline overran: the deadlines it missed
+        are skipped, so late scans don't bunch up to catch up, and counted unless
+        the scan didn't read (a link that is down is reported by the connection).'''
+        self.scans += 1
+        self.last_duration = finished - started
+        next_deadline = deadline + self.scan_period
+        was_late = self.late
+        self.late = read and finished > next_deadline
+        if finished > next_deadline:
+            missed = int((finished - deadline) // self.scan_period)
+            next_deadline = deadline + (missed + 1) * self.scan_period
+        if self.late:
+            self.overruns += missed
+            if not was_late and finished >= self.overrun_log_at:
+                self.overrun_log_at = finished + OVERRUN_LOG_INTERVAL
+                log.warning("%s scan of %s can't keep its %.0f ms period: finished %.0f ms after it was due, "
+                            "reads took %.0f ms, %d missed deadlines so far", self.scan_class, self.ip_address,
+                            self.scan_period * 1000, (finished - deadline) * 1000, self.last_duration * 1000,
+                            self.overruns)
+        return next_deadline
+
+
+class AcquisitionEngine:
+    '''Polls any number of PLCs at once and publishes their values on one queue'''
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, pool=None, change_only=True, metrics=None):
+        self.max_workers = max_workers
+        self.change_only = change_only
+        # A util.metrics.Metrics to time scans into, or None to not time anything
+        self.metrics = metrics
+        # Pass a pool to share connections with other consumers; an own pool is closed when run() ends
+        self.owns_pool = pool is None
+        self.pool = pool if pool is not None else ConnectionPool()
+        self.pollers = []
+        # Engine tag index -> (poller, index in the poller), and the queued writes of each connection
+        self.tag_pollers = {}
+        self.write_queues = {}
+        self.results = asyncio.Queue()
+        self.stopping = False
+        self.stopped = None
+
+    def add_plc(self, ip_address, rack, slot, tags, indices=None, scan_period=DEFAULT_SCAN_PERIOD, tcpport=102,
+                scan_class=DEFAULT_SCAN_CLASS):
+        '''Adds tags of a PLC to poll. indices are the numbers reported with each value (defaults to 0..n-1).
+
+        Adding a PLC more than once, e.g. once per scan class, shares its connection.'''
+        if indices is None:
+            indices = list(range(len(tags)))
+        connection = self.pool.get(ip_address, rack, slot, tcpport)
+        poller = PlcPoller(connection, tags, indices, scan_period, self.change_only, scan_class, self.metrics)
+        self.pollers.append(poller)
+        for i, index in enumerate(indices):
+            self.tag_pollers[index] = (poller, i)
+        self.write_queues.setdefault(connection, WriteQueue())
+        return poller
+
+    def add_tags(self, tags, rack, slot, scan_period=DEFAULT_SCAN_PERIOD, default_ip_address=None, scan_classes=None):
+        '''Adds one poller per distinct tag ip_address and scan_class; values are reported by index into tags.
+
+        scan_classes maps class names to periods and defaults to SCAN_CLASSES;
+        scan_period is the period of the normal class, which tags without a
+        scan_class belong to.'''
+        periods = dict(SCAN_CLASSES if scan_classes is None else scan_classes)
+        periods[DEFAULT_SCAN_CLASS] = scan_period
+        groups = {}
+        for i, tag in enumerate(tags):
+            ip_address = tag.get('ip_address') or default_ip_address
+            scan_class = tag.get('scan_class') or DEFAULT_SCAN_CLASS
+            if scan_class not in periods:
+                raise ValueError(f"Tag {tag.get('name')!r} has an unknown scan class {scan_class!r}, "
+                                 f"use one of {', '.join(periods)}")
+            groups.setdefault((ip_address, scan_class), []).append(i)
+        for (ip_address, scan_class), indices in groups.items():
+            self.add_plc(ip_address, rack, slot, [tags[i] for i in indices], indices, periods[scan_class],
+                         scan_class=scan_class)
+
+    def instrument(self, metrics):
+        '''Starts timing into metrics, or stops with None; may be called while running'''
+        self.metrics = metrics
+        for poller in self.pollers:
+            poller.instrument(metrics)
+
+    def write(self, index, value):
+        '''Queues a write of value to the tag reported as index; it is applied before the next scan of its PLC.
+
+        Safe to call from any thread. Raises ValueError if the value doesn't fit the tag.'''
+        poller, i = self.tag_pollers[index]
+        self.write_queues[poller.connection].put(poller.compiled[i], value)
+
+    def stop(self):
+        '''Asks every PLC to finish after its current scan'''
+        self.stopping = True
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def run(self):
+        '''Polls every PLC until stop() is called'''
+        self.stopping = False
+        self.stopped = asyncio.Event()
+        # The scan classes of a PLC share its connection, so each PLC gets one scheduler
+        by_connection = {}
+        for poller in self.pollers:
+            by_connection.setdefault(poller.connection, []).append(poller)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="snap7")
+        try:
+            await asyncio.gather(*(self.schedule(pollers, executor) for pollers in by_connection.values()))
+        finally:
+            if self.owns_pool:
+                await asyncio.get_running_loop().run_in_executor(executor, self.pool.close_all)
+            executor.shutdown(wait=True)
+
+    async def schedule(self, pollers, executor):
+        '''Runs the scans of the pollers of one PLC one at a time, earliest deadline first.
+
+        Deadlines come from the monotonic clock and advance by the scan period,
+        so the time spent reading counts towards the period.'''
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        # (deadline, position, poller); the position breaks ties in the order the pollers were added
+        deadlines = [(now, n, poller) for n, poller in enumerate(pollers)]
+        heapq.heapify(deadlines)
+        reported = None
+        writes = self.write_queues[pollers[0].connection]
+        while not self.stopping:
+            deadline, n, poller = deadlines[0]
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.stopped.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Queued writes go out together, right before the scan that will show their effect
+            if writes:
+                try:
+                    await loop.run_in_executor(executor, poller.connection.call, writes.flush)
+                except Exception as e:
+                    log.warning("Writing to %s failed: %s", poller.ip_address, e)
+
+            started = time.monotonic()
+            read = False
+            try:
+                values = await loop.run_in_executor(executor, poller.scan)
+                read = True
+            except LinkDownError:
+                # Still waiting for the next reconnect attempt
+                values = []
+            except Exception as e:
+                log.warning("Reading from %s failed: %s", poller.ip_address, e)
+                values = []
+            finished = time.monotonic()
+            next_deadline = poller.finish_scan(deadline, started, finished, read)
+            if self.metrics is not None:
+                now = time.perf_counter()
+                self.metrics.histogram(f"{poller.scan_class} scan jitter").record(started - deadline, now)
+                self.metrics.histogram(f"{poller.scan_class} scan").record(finished - started, now)
+            heapq.heapreplace(deadlines, (next_deadline, n, poller))
+
+            # Quiet scans are only worth a result when the link state changed
+            connected = poller.connection.connected
+            if values or connected != reported:
+                reported = connected
+                await self.results.put(ScanResult(poller.ip_address, time.time(), connected, values))
+
+    def link_summary(self):
+        '''Returns a one line summary of the link state of every PLC'''
+        status = self.pool.status()
+        connected = sum(1 for link in status if link['state'] == CONNECTED)
+        reconnects = sum(link['reconnects'] for link in status)
+        return f"{connected}/{len(status)} PLCs connected, {reconnects} reconnects"
+
+    def scan_summary(self):
+        '''Returns the overruns of every scan class as one line, or "" while every class keeps its rate'''
+        overruns = {}
+        for poller in self.pollers:
+            if poller.overruns:
+                overruns[poller.scan_class] = overruns.get(poller.scan_class, 0) + poller.overruns
+        if not overruns:
+            return ""
+        return "overruns: " + ", ".join(f"{scan_class} {count}" for scan_class, count in overruns.items())
+
+
+async def forward_batches(engine, handle, interrupted, timeout=0.1):
+    '''Runs an engine and calls handle(results) with every batch of results until interrupted() is true.
+
+    A batch is one result plus everything else already waiting, so a front end
+    updates once for all PLCs. interrupted is checked at least every timeout seconds.'''
+    polling = asyncio.create_task(engine.run())
+    while not interrupted() and not polling.done():
+        try:
+            results = [await asyncio.wait_for(engine.results.get(), timeout)]
+        except asyncio.TimeoutError:
+            continue
+        while not engine.results.empty():
+            results.append(engine.results.get_nowait())
+        handle(results)
+    engine.stop()
+    await polling
+
+
+def run_batches(engine, handle, interrupted, timeout=0.1):
+    '''forward_batches on a new event loop, for threads of programs that don't use asyncio themselves'''
+    asyncio.run(forward_batches(engine, handle, interrupted, timeout))
@@ -1,34 +1,26 @@
-import snap7
-import re
+import os
+import sys
 
-def parse_logical_address(logical_address):
-    result = re.match(r"%([IQM])([W]?)(\d+)(\.(\d+))?", logical_address)
-    if result:
-        area_letter, word_flag, byte_str, _, bit_str = result.groups()
-        byte = int(byte_str)
-        bit = int(bit_str) if bit_str else None
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-        area = {
-            'I': snap7.types.Areas.PE,
-            'Q': snap7.types.Areas.PA,
-            'M': snap7.types.Areas.MK,
-        }[area_letter]
+from util.address import parse_address
 
-        if word_flag == 'W':
-            tag_type = 'int'
-        elif bit is not None:
-            tag_type = 'bool'
-        else:
-            raise ValueError(f"Invalid logical address format: {logical_address}")
+def parse_logical_address(logical_address):
+    address = parse_address(logical_address)
 
-        return {
-            'area': area,
-            'type': tag_type,
-            'byte': byte,
-            'bit': bit,
-        }
+    if address.width == 'W':
+        tag_type = 'int'
+    elif address.bit is not None:
+        tag_type = 'bool'
+    else:
+        raise ValueError(f"Invalid logical address format: {logical_address}")
 
-    raise ValueError(f"Invalid logical address format: {logical_address}")
+    return {
+        'area': address.area,
+        'type': tag_type,
+        'byte': address.byte,
+        'bit': address.bit,
+    }
 
 # Example usage:
 logical_addresses = [
@@ -0,0 +1,270 @@
+'''Time-series historian: compact on-disk recording of polled values, with range queries
+
+Every series (one tag of one PLC) is an append-only file of chunks. A chunk
+holds up to CHUNK_SIZE samples as two compressed columns:
+
+- timestamps, in milliseconds, as zigzagged delta-of-deltas; a steady scan
+  period makes them almost all zero
+- values, as XOR with the previous value for floats (the Gorilla idea) or as
+  zigzagged deltas for integers and bools
+
+Both columns are byte-shuffled (all first bytes, then all second bytes, ...)
+before zlib, so the runs of zero bytes these transforms leave compress well.
+Other values (strings, dates, arrays) are stored as compressed JSON.
+
+HistorianSink writes from a background thread, so the scan loop only pays for a
+queue put. Historian reads the files, skipping chunks outside the queried range
+by their header.'''
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+CHUNK_SIZE = 4096
+# Partly filled chunks are written at least this often, in seconds, which bounds what a crash can lose
+FLUSH_INTERVAL = 60.0
+EXTENSION = ".hist"
+
+# magic, kind, sample count, first and last timestamp in ms, timestamp and value column sizes
+CHUNK_HEADER = struct.Struct('<4scIqqII')
+MAGIC = b'HST1'
+FLOAT, INTEGER, BOOL, OBJECT = b'f', b'i', b'b', b'o'
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return BOOL
+    if isinstance(value, int) and -(1 << 63) <= value < (1 << 63):
+        return INTEGER
+    if isinstance(value, float):
+        return FLOAT
+    return OBJECT
+
+
+def _shuffle(array):
+    '''Compresses an array of 8-byte items byte plane by byte plane'''
+    planes = array.view(np.uint8).reshape(len(array), 8).T
+    return zlib.compress(planes.tobytes())
+
+
+def _unshuffle(data, count, dtype):
+    planes = np.frombuffer(zlib.decompress(data), np.uint8).reshape(8, count)
+    return planes.T.copy().view(dtype).ravel()
+
+
+def _zigzag(deltas):
+    return ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+
+
+def _unzigzag(encoded):
+    return ((encoded >> np.uint64(1)).view(np.int64)) ^ -(encoded & np.uint64(1)).view(np.int64)
+
+
+def _deltas(array):
+    '''First-order differences of an int64 array, the first one taken from 0'''
+    return np.diff(array, prepend=np.int64(0))
+
+
+def encode_chunk(timestamps, values, kind):
+    '''Encodes timestamps (ms) and values of one kind into a chunk, header included'''
+    times = np.asarray(timestamps, dtype=np.int64)
+    times_data = _shuffle(_zigzag(_deltas(_deltas(times))))
+    if kind == FLOAT:
+        bits = np.asarray(values, dtype=np.float64).view(np.uint64)
+        values_data = _shuffle(bits ^ np.concatenate(([np.uint64(0)], bits[:-1])))
+    elif kind == OBJECT:
+        values_data = zlib.compress(json.dumps(values, default=str).encode())
+    else:
+        values_data = _shuffle(_zigzag(_deltas(np.asarray(values, dtype=np.int64))))
+    header = CHUNK_HEADER.pack(MAGIC, kind, len(times), int(times[0]), int(times[-1]), len(times_data), len(values_data))
+    return header + times_data + values_data
+
+
+def decode_chunk(kind, count, times_data, values_data):
+    '''Returns (timestamps in ms, values) of a chunk; values are a list for OBJECT chunks'''
+    times = np.cumsum(np.cumsum(_unzigzag(_unshuffle(times_data, count, np.uint64))))
+    if kind == FLOAT:
+        values = np.bitwise_xor.accumulate(_unshuffle(values_data, count, np.uint64)).view(np.float64)
+    elif kind == OBJECT:
+        values = json.loads(zlib.decompress(values_data))
+    else:
+        values = np.cumsum(_unzigzag(_unshuffle(values_data, count, np.uint64)))
+        if kind == BOOL:
+            values = values.astype(bool)
+    return times, values
+
+
+def series_file(directory, ip_address, name):
+    return os.path.join(directory, quote(f"{ip_address}/{name}", safe='') + EXTENSION)
+
+
+class _Series:
+    '''Samples of one series waiting to be written'''
+
+    __slots__ = ('path', 'kind', 'timestamps', 'values')
+
+    def __init__(self, path):
+        self.path = path
+        self.kind = None
+        self.timestamps = []
+        self.values = []
+
+    def take_chunk(self):
+        chunk = encode_chunk(self.timestamps, self.values, self.kind)
+        self.timestamps = []
+        self.values = []
+        return chunk
+
+
+class HistorianSink:
+    '''Records every value of every scan result to a historian directory.
+
+    Has the interface of the daemon's sinks; write() only queues the result.'''
+
+    def __init__(self, directory, chunk_size=CHUNK_SIZE, flush_interval=FLUSH_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.series = {}
+        self.thread = threading.Thread(target=self.run, name="historian", daemon=True)
+        self.thread.start()
+
+    def write(self, result, names):
+        if result.values:
+            self.queue.put((result, names))
+
+    def close(self):
+        '''Writes everything still queued or buffered and stops the writer thread'''
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        # Partly filled chunks are due by this time on the monotonic clock, however busy the queue is
+        flush_at = time.monotonic() + self.flush_interval
+        while True:
+            if time.monotonic() >= flush_at:
+                self.flush()
+                flush_at = time.monotonic() + self.flush_interval
+            try:
+                item = self.queue.get(timeout=max(0.0, flush_at - time.monotonic()))
+            except queue.Empty:
+                continue
+            # Take everything that is already waiting, so files are written once per batch
+            batch = [item]
+            while item is not None:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            chunks = {}
+            for item in batch:
+                if item is None:
+                    break
+                self.append(item, chunks)
+            self.write_chunks(chunks)
+            if batch[-1] is None:
+                self.flush()
+                return
+
+    def append(self, item, chunks):
+        '''Buffers the values of one result, moving full chunks into chunks'''
+        result, names = item
+        timestamp = int(round(result.timestamp * 1000))
+        for i, value in result.values:
+            key = (result.ip_address, names[i])
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series(series_file(self.directory, *key))
+            kind = _kind(value)
+            if series.kind != kind and series.values:
+                chunks.setdefault(series.path, []).append(series.take_chunk())
+            series.kind = kind
+            series.timestamps.append(timestamp)
+            series.values.append(value)
+            if len(series.values) >= self.chunk_size:
+                chunks.setdefault(series.path, []).append(series.take_chunk())
+
+    def flush(self):
+        '''Writes the partly filled chunks of every series'''
+        self.write_chunks({series.path: [series.take_chunk()] for series in self.series.values() if series.values})
+
+    def write_chunks(self, chunks):
+        for path, data in chunks.items():
+            with open(path, 'ab') as f:
+                f.write(b''.join(data))
+
+
+class Historian:
+    '''Reads recorded series. Sees the chunks HistorianSink has written so far.'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        # path -> (bytes indexed, [(first ms, last ms, kind, count, offset)])
+        self.indexes = {}
+
+    def series(self):
+        '''Returns the (ip_address, name) of every recorded series'''
+        found = []
+        for file_name in sorted(os.listdir(self.directory)):
+            if file_name.endswith(EXTENSION):
+                ip_address, _, name = unquote(file_name[:-len(EXTENSION)]).partition('/')
+                found.append((ip_address, name))
+        return found
+
+    def index(self, path):
+        '''Returns the chunk headers of a file, reading only what was appended since the last call'''
+        indexed, entries = self.indexes.get(path, (0, []))
+        size = os.path.getsize(path)
+        if size > indexed:
+            with open(path, 'rb') as f:
+                f.seek(indexed)
+                while indexed + CHUNK_HEADER.size <= size:
+                    magic, kind, count, first, last, times_size, values_size = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+                    end = indexed + CHUNK_HEADER.size + times_size + values_size
+                    if magic != MAGIC or end > size:
+                        # A chunk still being written, or cut short by a crash
+                        break
+                    entries.append((first, last, kind, count, indexed + CHUNK_HEADER.size, times_size, values_size))
+                    indexed = end
+                    f.seek(indexed)
+            self.indexes[path] = (indexed, entries)
+        return entries
+
+    def query(self, ip_address, name, start=None, end=None):
+        '''Returns (timestamps, values) of a series with start <= timestamp <= end, in seconds.
+
+        timestamps is a float64 array; values is an array, or a list if the
+        series has values that aren't numbers.'''
+        path = series_file(self.directory, ip_address, name)
+        if not os.path.exists(path):
+            return np.empty(0), np.empty(0)
+        start_ms = -(1 << 63) if start is None else int(round(start * 1000))
+        end_ms = (1 << 63) - 1 if end is None else int(round(end * 1000))
+
+        times, values = [], []
+        with open(path, 'rb') as f:
+            for first, last, kind, count, offset, times_size, values_size in self.index(path):
+                if last < start_ms or first > end_ms:
+                    continue
+                f.seek(offset)
+                chunk_times, chunk_values = decode_chunk(kind, count, f.read(times_size), f.read(values_size))
+                keep = (chunk_times >= start_ms) & (chunk_times <= end_ms)
+                times.append(chunk_times[keep])
+                values.append([v for v, k in zip(chunk_values, keep) if k] if kind == OBJECT else chunk_values[keep])
+
+        if not times:
+            return np.empty(0), np.empty(0)
+        timestamps = np.concatenate(times) / 1000.0
+        if any(isinstance(chunk, list) for chunk in values):
+            return timestamps, [value for chunk in values for value in chunk]
+        return timestamps, np.concatenate(values)
@@ -0,0 +1,141 @@
+'''Low-overhead rolling histograms for timing the acquisition hot path
+
+A Histogram counts values in log-spaced buckets (four per power of two, so
+percentiles are within about 12%) and keeps two windows: the current one and
+the one before it. Snapshots cover both, so they always describe the last
+one to two windows of activity.
+
+Instrumentation is off when no Metrics object is passed: the engine then runs
+the plain, untimed functions. Histograms take no lock, so records from several
+threads at once may very rarely lose a count.'''
+import json
+import threading
+import time
+
+DEFAULT_WINDOW = 10.0
+# Four buckets per power of two, up to values of 2**47 (microseconds: about 4 years)
+BUCKETS = 4 * 48
+# Values of unit "s" are counted in microseconds, any other unit as whole numbers
+SCALES = {'s': 1e6}
+
+
+def bucket(value):
+    '''Returns the bucket of a non-negative integer'''
+    bits = value.bit_length()
+    if bits <= 2:
+        return value
+    return (bits << 2) | ((value >> (bits - 3)) & 3)
+
+
+def bucket_value(index):
+    '''Returns the middle of the range of integers a bucket counts'''
+    if index < 4:
+        return index
+    shift = (index >> 2) - 3
+    low = (4 + (index & 3)) << shift
+    return low + ((1 << shift) - 1) / 2
+
+
+class _Window:
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+
+
+class Histogram:
+    '''Rolling histogram of one measurement'''
+
+    __slots__ = ('name', 'unit', 'scale', 'window', 'current', 'previous', 'rotate_at')
+
+    def __init__(self, name, unit='s', window=DEFAULT_WINDOW):
+        self.name = name
+        self.unit = unit
+        self.scale = SCALES.get(unit, 1)
+        self.window = window
+        self.current = _Window()
+        self.previous = _Window()
+        self.rotate_at = time.perf_counter() + window
+
+    def record(self, value, now):
+        '''Counts a value; now is the perf_counter() time the caller already has'''
+        if now >= self.rotate_at:
+            self.previous = self.current if now < self.rotate_at + self.window else _Window()
+            self.current = _Window()
+            self.rotate_at = now + self.window
+        scaled = int(value * self.scale)
+        if scaled < 0:
+            scaled = 0
+        window = self.current
+        window.counts[min(bucket(scaled), BUCKETS - 1)] += 1
+        window.count += 1
+        window.total += scaled
+        if scaled > window.maximum:
+            window.maximum = scaled
+
+    def snapshot(self):
+        '''Returns count, mean, p50, p90, p99 and max over the last one to two windows, in the histogram's unit'''
+        windows = (self.previous, self.current)
+        count = sum(window.count for window in windows)
+        stats = {"unit": self.unit, "count": count}
+        if not count:
+            return stats
+        counts = [a + b for a, b in zip(self.previous.counts, self.current.counts)]
+        stats["mean"] = sum(window.total for window in windows) / count / self.scale
+        for label, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            rank = fraction * count
+            seen = 0
+            for index, bucket_count in enumerate(counts):
+                seen += bucket_count
+                if seen >= rank:
+                    stats[label] = bucket_value(index) / self.scale
+                    break
+        stats["max"] = max(window.maximum for window in windows) / self.scale
+        return stats
+
+
+class Metrics:
+    '''A named set of histograms, created on first use'''
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.histograms = {}
+        # Only guards creating histograms, recording doesn't lock
+        self.lock = threading.Lock()
+
+    def histogram(self, name, unit='s'):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram(name, unit, self.window)
+        return histogram
+
+    def snapshot(self):
+        '''Returns {name: stats} of every histogram, see Histogram.snapshot'''
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        return {name: histogram.snapshot() for name, histogram in histograms}
+
+    def to_json(self):
+        return json.dumps({"time": time.time(), "window": self.window, "histograms": self.snapshot()}, indent=2)
+
+    def summary(self, names=None):
+        '''Returns the p50 and p99 of some histograms (all by default) as one line'''
+        parts = []
+        for name, stats in self.snapshot().items():
+            if names is not None and name not in names or not stats["count"]:
+                continue
+            parts.append(f"{name} {format_stat(stats['p50'], stats['unit'])}/{format_stat(stats['p99'], stats['unit'])}")
+        return ", ".join(parts)
+
+
+def format_stat(value, unit):
+    '''Formats a statistic for display: durations in ms, anything else as a number with its unit'''
+    if unit == 's':
+        return f"{value * 1000:.2f} ms"
+    return f"{value:.0f} {unit}"
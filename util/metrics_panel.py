@@ -0,0 +1,63 @@
+'''Dock panel showing the rolling histograms of a util.metrics.Metrics'''
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (QApplication, QDockWidget, QHeaderView, QPushButton, QTableWidget, QTableWidgetItem,
+                             QVBoxLayout, QWidget)
+
+from util.metrics import format_stat
+
+STAT_COLUMNS = ["count", "mean", "p50", "p90", "p99", "max"]
+REFRESH_INTERVAL = 1000  # ms
+
+
+class MetricsPanel(QDockWidget):
+    '''Table of every histogram, refreshed once a second while the panel is visible'''
+
+    def __init__(self, parent=None):
+        super().__init__("Performance", parent)
+        self.metrics = None
+
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        self.table = QTableWidget(0, len(STAT_COLUMNS))
+        self.table.setHorizontalHeaderLabels(STAT_COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.copy_button = QPushButton("Copy Snapshot")
+        self.copy_button.setToolTip("Copy the statistics as JSON")
+        self.copy_button.clicked.connect(self.copy_snapshot)
+        layout.addWidget(self.copy_button)
+        self.setWidget(widget)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.toggle_refresh)
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+        self.refresh()
+
+    def toggle_refresh(self, visible):
+        if visible:
+            self.timer.start(REFRESH_INTERVAL)
+        else:
+            self.timer.stop()
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot() if self.metrics is not None else {}
+        self.table.setRowCount(len(snapshot))
+        self.table.setVerticalHeaderLabels(list(snapshot))
+        for row, stats in enumerate(snapshot.values()):
+            for column, key in enumerate(STAT_COLUMNS):
+                if key not in stats:
+                    text = ""
+                elif key == "count":
+                    text = str(stats[key])
+                else:
+                    text = format_stat(stats[key], stats["unit"])
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+    def copy_snapshot(self):
+        if self.metrics is not None:
+            QApplication.clipboard().setText(self.metrics.to_json())
@@ -0,0 +1,269 @@
+'''Read planner that coalesces tag reads into as few S7 requests as possible'''
+import ctypes
+from snap7.common import check_error, error_text
+from snap7.types import Areas, S7DataItem, WordLen
+
+# Bytes of every read response PDU that are taken up by headers instead of data
+PDU_OVERHEAD = 18
+# PDU length most CPUs negotiate when nothing else is known
+DEFAULT_PDU_LENGTH = 480
+# Smallest PDU length S7 CPUs negotiate (S7-300 and many S7-400s)
+MIN_PDU_LENGTH = 240
+# Largest hole (in bytes) between two tags that is still cheaper to read than to skip
+DEFAULT_MAX_GAP = 32
+# snap7 refuses read_multi_vars calls with more items than this
+MAX_MULTI_VARS = 20
+# Bytes of a multi-var response taken up by the header, and by each item
+MULTI_VAR_OVERHEAD = 14
+MULTI_VAR_ITEM_OVERHEAD = 4
+# Bytes of a multi-var request taken up by the header, and by the address of each item;
+# with 240-byte PDUs this is what limits a request to 19 items
+MULTI_VAR_REQUEST_OVERHEAD = 12
+MULTI_VAR_REQUEST_ITEM_SIZE = 12
+# snap7 errors that concern one item of a request (a missing DB, an address past the end of an area,
+# a protected area) rather than the request or the link, so the other items can still be used
+ITEM_ERRORS = {0x00900000, 0x00A00000, 0x00B00000, 0x00C00000, 0x01D00000}
+
+
+class ShortReadError(RuntimeError):
+    '''Raised when a read returns fewer bytes than were asked for'''
+
+
+class ReadBlock:
+    '''A contiguous byte range of one area/DB that is read with a single request'''
+
+    def __init__(self, area, db_number, start, size):
+        self.area = area
+        self.db_number = db_number
+        self.start = start
+        self.size = size
+        # (tag index, byte offset of the tag inside this block)
+        self.members = []
+
+    def __repr__(self):
+        return f"<ReadBlock {self.area} db={self.db_number} start={self.start} size={self.size} tags={len(self.members)}>"
+
+
+def max_block_size(pdu_length=DEFAULT_PDU_LENGTH):
+    '''Returns the largest payload that fits in one read response'''
+    return pdu_length - PDU_OVERHEAD
+
+
+def plan_blocks(spans, max_gap=DEFAULT_MAX_GAP, pdu_length=DEFAULT_PDU_LENGTH):
+    '''Groups tag spans into read blocks.
+
+    spans holds one (area, db_number, start, size) tuple per tag, in tag order.
+    A span of None is skipped, so callers can keep their indices for tags that
+    can't be read. Spans of the same area/DB are merged while the hole between
+    them is at most max_gap bytes and the block still fits in one PDU.'''
+    max_size = max_block_size(pdu_length)
+    order = sorted(
+        (i for i, span in enumerate(spans) if span is not None),
+        key=lambda i: (spans[i][0].value, spans[i][1], spans[i][2], -spans[i][3]),
+    )
+
+    blocks = []
+    block = None
+    for index in order:
+        area, db_number, start, size = spans[index]
+        end = start + size
+        if (block is not None
+                and block.area == area
+                and block.db_number == db_number
+                and start - (block.start + block.size) <= max_gap
+                and max(end, block.start + block.size) - block.start <= max_size):
+            block.size = max(block.size, end - block.start)
+        else:
+            block = ReadBlock(area, db_number, start, size)
+            blocks.append(block)
+        block.members.append((index, start - block.start))
+
+    return blocks
+
+
+def read_block(plc, block):
+    '''Reads a whole block with one read_area call'''
+    data = plc.read_area(block.area, block.db_number, block.start, block.size)
+    if len(data) < block.size:
+        raise ShortReadError(f"Reading {block} returned {len(data)} bytes")
+    return data
+
+
+def multi_var_size(block):
+    '''Returns the bytes a block takes up in a read_multi_vars response'''
+    # Items are padded to an even length inside the response
+    return MULTI_VAR_ITEM_OVERHEAD + block.size + (block.size & 1)
+
+
+def max_multi_vars(pdu_length=DEFAULT_PDU_LENGTH):
+    '''Returns the most items one multi-var request can address'''
+    return min(MAX_MULTI_VARS, (pdu_length - MULTI_VAR_REQUEST_OVERHEAD) // MULTI_VAR_REQUEST_ITEM_SIZE)
+
+
+def pack_multi_vars(blocks, pdu_length=DEFAULT_PDU_LENGTH, overhead=MULTI_VAR_OVERHEAD, item_size=multi_var_size):
+    '''Packs blocks into requests of at most max_multi_vars items that fit in one PDU.
+
+    Returns a list of requests, each a list of blocks. A request holding a single
+    block is read with read_area, so blocks too big to share a PDU stay on their own.
+    overhead and item_size default to the sizes of a read response; writes pass
+    their own (see util.writer).'''
+    room = pdu_length - overhead
+    max_items = max_multi_vars(pdu_length)
+    requests = []
+    # First-fit decreasing: the big blocks claim their batches before the small ones fill the gaps
+    for block in sorted(blocks, key=lambda block: block.size, reverse=True):
+        size = item_size(block)
+        for request in requests:
+            if len(request[1]) < max_items and request[0] + size <= room:
+                request[0] += size
+                request[1].append(block)
+                break
+        else:
+            requests.append([size, [block]])
+    return [request[1] for request in requests]
+
+
+def plan_cost(requests):
+    '''Returns (round trips, payload bytes) of a plan, in the order plans are compared'''
+    return len(requests), sum(block.size for request in requests for block in request)
+
+
+def plan_reads(spans, max_gap=DEFAULT_MAX_GAP, pdu_length=DEFAULT_PDU_LENGTH, multi_vars=True):
+    '''Plans the requests needed to read every span and returns the cheapest plan.
+
+    Candidates are plain coalesced blocks, the same blocks packed into
+    read_multi_vars batches, and tight (gapless) blocks packed into batches.
+    The plan with the fewest round trips wins, then the one moving fewer bytes.'''
+    blocks = plan_blocks(spans, max_gap, pdu_length)
+    candidates = [[[block] for block in blocks]]
+    if multi_vars:
+        candidates.append(pack_multi_vars(blocks, pdu_length))
+        candidates.append(pack_multi_vars(plan_blocks(spans, 0, pdu_length), pdu_length))
+    return min(candidates, key=plan_cost)
+
+
+def word_len(area):
+    '''Returns the WordLen an area is read with'''
+    if area == Areas.TM:
+        return WordLen.Timer
+    if area == Areas.CT:
+        return WordLen.Counter
+    return WordLen.Byte
+
+
+def buffer_size(block):
+    '''Returns the bytes a block takes up once read; timers and counters are 2 bytes each'''
+    return block.size * (2 if block.area in (Areas.TM, Areas.CT) else 1)
+
+
+def fill_items(items, blocks, buffers):
+    '''Points the S7DataItems of a multi-var request at a ctypes buffer per block'''
+    for item, block, buffer in zip(items, blocks, buffers):
+        item.WordLen = word_len(block.area).value
+        item.Area = block.area.value
+        item.DBNumber = block.db_number
+        item.Start = block.start
+        item.Amount = block.size
+        item.pData = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint8))
+
+
+def check_items(items, blocks):
+    for item, block in zip(items, blocks):
+        if item.Result != 0:
+            raise RuntimeError(f"Reading {block} failed with snap7 error {item.Result:#x}")
+
+
+def read_multi_vars(plc, blocks):
+    '''Reads several blocks with one read_multi_vars call and returns a buffer per block'''
+    items = (S7DataItem * len(blocks))()
+    buffers = [(ctypes.c_uint8 * buffer_size(block))() for block in blocks]
+    fill_items(items, blocks, buffers)
+    plc.read_multi_vars(items)
+    check_items(items, blocks)
+    return [bytearray(buffer) for buffer in buffers]
+
+
+def read_request(plc, request):
+    '''Reads one planned request and returns a buffer per block'''
+    if len(request) == 1:
+        return [read_block(plc, request[0])]
+    return read_multi_vars(plc, request)
+
+
+class ReadBuffers:
+    '''Preallocated buffers a plan is read into, scan after scan, without allocating new ones.
+
+    Every block has two bytearrays: a scan reads into one side while the other
+    keeps the previous scan, and swap() trades the sides once a scan is
+    complete, so change detection compares the two in place. The ctypes views
+    of the buffers and the S7DataItem arrays of the multi-var requests are
+    built once, per side.
+
+    A block the PLC refuses (see ITEM_ERRORS) doesn't fail its request: ok()
+    tells which blocks were read, and errors holds why the others weren't.'''
+
+    def __init__(self, requests):
+        self.requests = requests
+        # [request][side] -> a bytearray per block
+        self.buffers = []
+        # [request][side] -> the ctypes array over the buffer of a single block, or the S7DataItem array
+        self.targets = []
+        for request in requests:
+            sides, targets = [], []
+            for _ in range(2):
+                buffers = [bytearray(buffer_size(block)) for block in request]
+                views = [(ctypes.c_uint8 * len(buffer)).from_buffer(buffer) for buffer in buffers]
+                if len(request) == 1:
+                    targets.append(views[0])
+                else:
+                    items = (S7DataItem * len(request))()
+                    fill_items(items, request, views)
+                    # The items only hold raw pointers, the views keep the buffers exported
+                    items.views = views
+                    targets.append(items)
+                sides.append(buffers)
+            self.buffers.append(sides)
+            self.targets.append(targets)
+        # [request][side] -> whether each block was read into that side
+        self.valid = [[[False] * len(request) for _ in range(2)] for request in requests]
+        # [request] -> the error text of each block the last read of the request refused, else None
+        self.errors = [[None] * len(request) for request in requests]
+        self.side = 0
+
+    def read(self, plc, n):
+        '''Reads request number n into the current side and returns its buffer per block'''
+        request = self.requests[n]
+        target = self.targets[n][self.side]
+        valid = self.valid[n][self.side]
+        errors = self.errors[n]
+        if len(request) == 1:
+            block = request[0]
+            # Client.read_area would return a new bytearray, the library call fills ours
+            code = plc._lib.Cli_ReadArea(plc._s7_client, block.area.value, block.db_number, block.start,
+                                         block.size, word_len(block.area).value, target)
+            if code not in ITEM_ERRORS:
+                check_error(code, context="client")
+            self.set_result(valid, errors, 0, code)
+        else:
+            plc.read_multi_vars(target)
+            for i, item in enumerate(target):
+                self.set_result(valid, errors, i, item.Result)
+        return self.buffers[n][self.side]
+
+    @staticmethod
+    def set_result(valid, errors, i, code):
+        valid[i] = code == 0
+        errors[i] = None if code == 0 else error_text(code, "client").decode(errors='replace')
+
+    def ok(self, n, i):
+        '''Tells if block i of request n was read by the current scan'''
+        return self.valid[n][self.side][i]
+
+    def unchanged(self, n, i):
+        '''Tells if block i of request n read the same bytes as in the previous scan'''
+        valid = self.valid[n]
+        return valid[0][i] and valid[1][i] and self.buffers[n][0][i] == self.buffers[n][1][i]
+
+    def swap(self):
+        '''Ends a complete scan: the next one reads into the other side'''
+        self.side ^= 1
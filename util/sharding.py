@@ -0,0 +1,333 @@
+'''Acquisition sharded over worker processes, with values returned through shared memory
+
+ShardedEngine has the interface of AcquisitionEngine, but spreads the PLCs over
+worker processes that each run their own AcquisitionEngine, so decoding and
+change detection use more than one core. Every scan result comes back through
+a single-producer/single-consumer ring buffer in multiprocessing.shared_memory:
+numbers and bools as fixed 16-byte entries, and only values that aren't
+numbers (strings, dates, arrays) pickled.
+
+All scan classes of a PLC go to the same worker, because they share its
+connection.'''
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from util.engine import DEFAULT_MAX_WORKERS, DEFAULT_SCAN_CLASS, DEFAULT_SCAN_PERIOD, AcquisitionEngine, ScanResult
+from util.connection import CONNECTED
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RING_SIZE = 4 << 20
+# How often a worker reports its link and overrun state, in seconds
+STATUS_INTERVAL = 1.0
+# How long the parent sleeps when no ring has anything to read, in seconds
+IDLE_POLL = 0.002
+
+# Ring buffer layout: write position and read position (both ever-growing), then the data
+RING_HEADER = struct.Struct('<QQ')
+# Messages: total length, type, connected flag, ip id, timestamp, entry count
+MESSAGE_HEADER = struct.Struct('<IBBHdI')
+SCAN, STATUS = 0, 1
+# Entries: engine tag index, kind, 3 pad bytes, value as 8 bytes (float64, int64, or pickled length)
+ENTRY = np.dtype([('index', '<u4'), ('kind', 'u1'), ('pad', 'V3'), ('value', '<f8')])
+FLOAT, INTEGER, BOOL, PICKLED = 0, 1, 2, 3
+KINDS = {float: FLOAT, int: INTEGER, bool: BOOL}
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+class RingBuffer:
+    '''Single-producer/single-consumer byte ring over a shared memory block'''
+
+    def __init__(self, name=None, size=DEFAULT_RING_SIZE):
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=RING_HEADER.size + size)
+            RING_HEADER.pack_into(self.memory.buf, 0, 0, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.size = self.memory.size - RING_HEADER.size
+        self.data = self.memory.buf[RING_HEADER.size:]
+
+    def close(self, unlink=False):
+        self.data.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+    def put(self, message):
+        '''Appends a message without waiting; returns False, and writes nothing, while the ring is too full'''
+        length = len(message)
+        if length > self.size:
+            raise ValueError(f"Message of {length} bytes doesn't fit a ring of {self.size}")
+        head, tail = RING_HEADER.unpack_from(self.memory.buf, 0)
+        if self.size - (head - tail) < length:
+            return False
+        start = head % self.size
+        first = min(length, self.size - start)
+        self.data[start:start + first] = message[:first]
+        if first < length:
+            self.data[:length - first] = message[first:]
+        # Publish the data before moving the write position
+        struct.pack_into('<Q', self.memory.buf, 0, head + length)
+        return True
+
+    def take(self):
+        '''Returns every byte written since the last take, and frees its room'''
+        head, tail = RING_HEADER.unpack_from(self.memory.buf, 0)
+        if head == tail:
+            return b''
+        start = tail % self.size
+        length = head - tail
+        first = min(length, self.size - start)
+        data = bytes(self.data[start:start + first])
+        if first < length:
+            data += bytes(self.data[:length - first])
+        struct.pack_into('<Q', self.memory.buf, 8, head)
+        return data
+
+
+def encode_result(result, ip_id):
+    '''Packs a ScanResult into a message'''
+    count = len(result.values)
+    entries = np.zeros(count, ENTRY)
+    extra = []
+    if count:
+        indices, values = zip(*result.values)
+        entries['index'] = indices
+        kinds = [KINDS.get(type(value), PICKLED) for value in values]
+        if not any(kinds):
+            entries['value'] = values
+        else:
+            numbers = entries['value']
+            integers = numbers.view('<i8')
+            for n, (kind, value) in enumerate(zip(kinds, values)):
+                if kind == INTEGER and not INT64_MIN <= value <= INT64_MAX:
+                    kind = kinds[n] = PICKLED
+                if kind == FLOAT or kind == BOOL:
+                    numbers[n] = value
+                elif kind == INTEGER:
+                    integers[n] = value
+                else:
+                    data = pickle.dumps(value)
+                    integers[n] = len(data)
+                    extra.append(data)
+            entries['kind'] = kinds
+    body = entries.tobytes() + b''.join(extra)
+    header = MESSAGE_HEADER.pack(MESSAGE_HEADER.size + len(body), SCAN, result.connected, ip_id,
+                                 result.timestamp, count)
+    return header + body
+
+
+def encode_status(status):
+    body = pickle.dumps(status)
+    return MESSAGE_HEADER.pack(MESSAGE_HEADER.size + len(body), STATUS, 0, 0, 0.0, 0) + body
+
+
+def decode_messages(data, ip_addresses):
+    '''Yields ScanResults and status dicts from the bytes of a ring'''
+    offset = 0
+    while offset < len(data):
+        length, kind, connected, ip_id, timestamp, count = MESSAGE_HEADER.unpack_from(data, offset)
+        body = offset + MESSAGE_HEADER.size
+        if kind == STATUS:
+            yield pickle.loads(data[body:offset + length])
+            offset += length
+            continue
+
+        entries = np.frombuffer(data, ENTRY, count, body)
+        kinds = entries['kind']
+        values = entries['value'].tolist()
+        if kinds.any():
+            integers = entries['value'].view('<i8')
+            for n in np.flatnonzero(kinds == INTEGER).tolist():
+                values[n] = int(integers[n])
+            for n in np.flatnonzero(kinds == BOOL).tolist():
+                values[n] = values[n] != 0
+            extra = body + count * ENTRY.itemsize
+            for n in np.flatnonzero(kinds == PICKLED).tolist():
+                size = int(integers[n])
+                values[n] = pickle.loads(data[extra:extra + size])
+                extra += size
+        yield ScanResult(ip_addresses[ip_id], timestamp, bool(connected), list(zip(entries['index'].tolist(), values)))
+        offset += length
+
+
+def worker_main(plcs, ip_addresses, ring_name, commands, stop_event, change_only, max_workers):
+    '''Entry point of a worker process: polls its PLCs and puts every result into the ring'''
+    # Ctrl+C reaches the whole process group; the parent stops the workers through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = RingBuffer(ring_name)
+    ip_ids = {ip_address: n for n, ip_address in enumerate(ip_addresses)}
+    engine = AcquisitionEngine(max_workers=max_workers, change_only=change_only)
+    for plc in plcs:
+        engine.add_plc(**plc)
+
+    async def send(message):
+        # The parent drains the rings until every worker has exited, so a full ring only
+        # means it is behind; once stopping, what it won't read any more is dropped
+        while not ring.put(message):
+            if stop_event.is_set():
+                return
+            await asyncio.sleep(IDLE_POLL)
+
+    async def forward():
+        polling = asyncio.create_task(engine.run())
+        next_status = 0.0
+        while not polling.done():
+            if stop_event.is_set():
+                engine.stop()
+            while True:
+                try:
+                    index, value = commands.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    engine.write(index, value)
+                except (KeyError, ValueError) as e:
+                    log.warning("Writing tag %s failed: %s", index, e)
+            try:
+                result = await asyncio.wait_for(engine.results.get(), 0.05)
+                await send(encode_result(result, ip_ids[result.ip_address]))
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() >= next_status:
+                next_status = time.monotonic() + STATUS_INTERVAL
+                overruns = {}
+                for poller in engine.pollers:
+                    overruns[poller.scan_class] = overruns.get(poller.scan_class, 0) + poller.overruns
+                # A full ring drops the status; the next one follows within STATUS_INTERVAL
+                ring.put(encode_status({"links": engine.pool.status(), "overruns": overruns}))
+        await polling
+
+    try:
+        asyncio.run(forward())
+    finally:
+        ring.close()
+
+
+class ShardedEngine:
+    '''AcquisitionEngine look-alike that polls from several worker processes'''
+
+    def __init__(self, processes=None, max_workers=DEFAULT_MAX_WORKERS, change_only=True, ring_size=DEFAULT_RING_SIZE):
+        self.processes = processes or os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.change_only = change_only
+        self.ring_size = ring_size
+        # Keyword arguments of AcquisitionEngine.add_plc, one dict per call
+        self.plcs = []
+        self.results = asyncio.Queue()
+        self.stopping = False
+        self.shard_of_tag = {}
+        self.commands = []
+        self.status = {}
+
+    def add_plc(self, ip_address, rack, slot, tags, indices=None, scan_period=DEFAULT_SCAN_PERIOD, tcpport=102,
+                scan_class=DEFAULT_SCAN_CLASS):
+        '''Adds tags of a PLC to poll, like AcquisitionEngine.add_plc'''
+        if indices is None:
+            indices = list(range(len(tags)))
+        self.plcs.append(dict(ip_address=ip_address, rack=rack, slot=slot, tags=tags, indices=indices,
+                              scan_period=scan_period, tcpport=tcpport, scan_class=scan_class))
+
+    add_tags = AcquisitionEngine.add_tags
+
+    def shards(self):
+        '''Splits the PLCs over the processes, biggest endpoint first onto the least loaded process'''
+        endpoints = {}
+        for plc in self.plcs:
+            key = (plc['ip_address'], plc['rack'], plc['slot'], plc['tcpport'])
+            endpoints.setdefault(key, []).append(plc)
+        shards = [[] for _ in range(min(self.processes, len(endpoints)))]
+        loads = [0] * len(shards)
+        for plcs in sorted(endpoints.values(), key=lambda plcs: -sum(len(plc['tags']) for plc in plcs)):
+            n = loads.index(min(loads))
+            shards[n].extend(plcs)
+            loads[n] += sum(len(plc['tags']) for plc in plcs)
+        return shards
+
+    def write(self, index, value):
+        '''Queues a write, like AcquisitionEngine.write; the worker polling the tag applies it'''
+        if not self.commands:
+            raise ValueError("Not reading yet")
+        self.commands[self.shard_of_tag[index]].put((index, value))
+
+    def stop(self):
+        self.stopping = True
+
+    async def run(self):
+        '''Starts the workers and forwards their results to self.results until stop() is called'''
+        self.stopping = False
+        context = multiprocessing.get_context("spawn")
+        stop_event = context.Event()
+        ip_addresses = sorted({plc['ip_address'] for plc in self.plcs})
+        rings, workers = [], []
+        try:
+            for n, plcs in enumerate(self.shards()):
+                ring = RingBuffer(size=self.ring_size)
+                rings.append(ring)
+                commands = context.Queue()
+                self.commands.append(commands)
+                for plc in plcs:
+                    for index in plc['indices']:
+                        self.shard_of_tag[index] = n
+                worker = context.Process(target=worker_main, name=f"acquisition-{n}", daemon=True, args=(
+                    plcs, ip_addresses, ring.name, commands, stop_event, self.change_only, self.max_workers))
+                worker.start()
+                workers.append(worker)
+
+            while not self.stopping and any(worker.is_alive() for worker in workers):
+                if not await self.drain(rings, ip_addresses):
+                    await asyncio.sleep(IDLE_POLL)
+        finally:
+            stop_event.set()
+            # Keep draining until the workers are gone, so none is left waiting for room in its ring
+            while any(worker.is_alive() for worker in workers):
+                if not await self.drain(rings, ip_addresses):
+                    await asyncio.sleep(IDLE_POLL)
+            for worker in workers:
+                worker.join()
+            await self.drain(rings, ip_addresses)
+            for ring in rings:
+                ring.close(unlink=True)
+            self.commands = []
+
+    async def drain(self, rings, ip_addresses):
+        '''Moves everything in the rings to the results queue; returns whether there was anything'''
+        busy = False
+        for n, ring in enumerate(rings):
+            data = ring.take()
+            if not data:
+                continue
+            busy = True
+            for message in decode_messages(data, ip_addresses):
+                if isinstance(message, ScanResult):
+                    await self.results.put(message)
+                else:
+                    self.status[n] = message
+        return busy
+
+    def link_summary(self):
+        links = [link for status in self.status.values() for link in status["links"]]
+        connected = sum(1 for link in links if link['state'] == CONNECTED)
+        reconnects = sum(link['reconnects'] for link in links)
+        return f"{connected}/{len(links)} PLCs connected, {reconnects} reconnects, {len(self.status)} processes"
+
+    def scan_summary(self):
+        overruns = {}
+        for status in self.status.values():
+            for scan_class, count in status["overruns"].items():
+                if count:
+                    overruns[scan_class] = overruns.get(scan_class, 0) + count
+        if not overruns:
+            return ""
+        return "overruns: " + ", ".join(f"{scan_class} {count}" for scan_class, count in overruns.items())
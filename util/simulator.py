@@ -0,0 +1,146 @@
+'''Local PLC simulator for tuning and benchmarking the poller without a live line
+
+PlcSimulator runs a snap7 server with PE, PA, MK and DB areas full of synthetic
+data. Clients connect through a small TCP proxy that can delay every request
+to mimic a real network and that counts the bytes on the wire.'''
+import ctypes
+import random
+import socket
+import threading
+import time
+
+import snap7
+from snap7.types import srvAreaDB, srvAreaMK, srvAreaPA, srvAreaPE
+
+# The server keeps area sizes in 16 bits, so this is the largest area it accepts
+DEFAULT_AREA_SIZE = 65535
+DEFAULT_DB_NUMBERS = (1, 2, 3, 4)
+
+
+class LatencyProxy:
+    '''Forwards TCP connections to a target port, delaying each request and counting bytes'''
+
+    def __init__(self, target_port, latency=0.0, host="127.0.0.1"):
+        self.target_port = target_port
+        self.latency = latency
+        self.host = host
+        self.bytes_sent = 0       # client -> PLC
+        self.bytes_received = 0   # PLC -> client
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, 0))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+        self.running = False
+        self.sockets = []
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.accept, name="proxy-accept", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.listener.close()
+        for sock in self.sockets:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def reset_counters(self):
+        with self.lock:
+            self.bytes_sent = self.bytes_received = self.requests = 0
+
+    def accept(self):
+        while self.running:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection((self.host, self.target_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.sockets.append(sock)
+            threading.Thread(target=self.forward, args=(client, upstream, True), daemon=True).start()
+            threading.Thread(target=self.forward, args=(upstream, client, False), daemon=True).start()
+
+    def forward(self, source, target, is_request):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if is_request and self.latency:
+                    time.sleep(self.latency)
+                with self.lock:
+                    if is_request:
+                        self.bytes_sent += len(data)
+                        self.requests += 1
+                    else:
+                        self.bytes_received += len(data)
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, target):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class PlcSimulator:
+    '''A snap7 server with synthetic PE/PA/MK/DB areas, reachable at ("127.0.0.1", port)'''
+
+    def __init__(self, area_size=DEFAULT_AREA_SIZE, db_numbers=DEFAULT_DB_NUMBERS, latency=0.0, seed=0, tcpport=1102):
+        self.area_size = area_size
+        self.db_numbers = db_numbers
+        self.latency = latency
+        self.seed = seed
+        self.tcpport = tcpport
+        self.server = None
+        self.proxy = None
+        # Keeps the registered buffers alive for as long as the server uses them
+        self.areas = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def port(self):
+        '''The port clients connect to'''
+        return self.proxy.port
+
+    def start(self):
+        rng = random.Random(self.seed)
+        self.server = snap7.server.Server(log=False)
+        for name, code, index in [('PE', srvAreaPE, 0), ('PA', srvAreaPA, 0), ('MK', srvAreaMK, 0)] + [
+                (f'DB{number}', srvAreaDB, number) for number in self.db_numbers]:
+            buffer = (ctypes.c_uint8 * self.area_size).from_buffer_copy(rng.randbytes(self.area_size))
+            self.server.register_area(code, index, buffer)
+            self.areas[name] = buffer
+        self.server.start(tcpport=self.tcpport)
+        self.proxy = LatencyProxy(self.tcpport, self.latency)
+        self.proxy.start()
+
+    def stop(self):
+        if self.proxy is not None:
+            self.proxy.stop()
+            self.proxy = None
+        if self.server is not None:
+            self.server.stop()
+            self.server.destroy()
+            self.server = None
+
+    def mutate(self, fraction=0.01):
+        '''Changes a random fraction of the bytes of every area, like a running process would'''
+        rng = random.Random()
+        for buffer in self.areas.values():
+            for _ in range(int(len(buffer) * fraction)):
+                buffer[rng.randrange(len(buffer))] = rng.randrange(256)
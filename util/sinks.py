@@ -0,0 +1,61 @@
+'''Output sinks for the headless acquisition daemon'''
+import csv
+import json
+from datetime import datetime
+
+
+class StdoutSink:
+    '''Prints one "time ip name: value" line per value'''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result, names):
+        timestamp = datetime.fromtimestamp(result.timestamp).isoformat(timespec='milliseconds')
+        for i, value in result.values:
+            self.stream.write(f"{timestamp} {result.ip_address} {names[i]}: {value}\n")
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    '''Writes one JSON object per value'''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result, names):
+        for i, value in result.values:
+            record = {"ts": result.timestamp, "ip": result.ip_address, "tag": names[i], "value": value}
+            # Dates, times and the like are written as their string form
+            self.stream.write(json.dumps(record, default=str))
+            self.stream.write("\n")
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class CsvSink:
+    '''Writes a timestamp,ip,tag,value row per value'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = csv.writer(stream)
+        self.writer.writerow(["timestamp", "ip", "tag", "value"])
+
+    def write(self, result, names):
+        self.writer.writerows((result.timestamp, result.ip_address, names[i], value) for i, value in result.values)
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+SINKS = {
+    'stdout': StdoutSink,
+    'jsonl': JsonLinesSink,
+    'csv': CsvSink,
+}
@@ -0,0 +1,108 @@
+'''Qt table model of the tag list, backed by one list per column'''
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+# (header label, tag dict key); the value column has no key because it isn't saved
+COLUMNS = [
+    ("IP", "ip_address"),
+    ("Name", "name"),
+    ("Type", "type"),
+    ("area", "area"),
+    ("DB", "db_number"),
+    ("Byte", "byte"),
+    ("Bit", "bit"),
+    ("Scan", "scan_class"),
+    ("Value", None),
+]
+VALUE_COLUMN = len(COLUMNS) - 1
+TYPE_COLUMN = [key for _, key in COLUMNS].index("type")
+SCAN_COLUMN = [key for _, key in COLUMNS].index("scan_class")
+# Keys that only live in the extra JSON of the tag store; a row leaves them out while empty
+OPTIONAL_KEYS = {"scan_class"}
+
+
+class TagTableModel(QAbstractTableModel):
+    '''Tag table that updates values in place and repaints a whole batch with one dataChanged'''
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = [[] for _ in COLUMNS]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns[0])
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return self.columns[index.column()][index.row()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section][0]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() != VALUE_COLUMN:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or index.column() == VALUE_COLUMN:
+            return False
+        self.columns[index.column()][index.row()] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def add_tags(self, tags):
+        '''Appends tag dicts as new rows'''
+        if not tags:
+            return
+        row = self.rowCount()
+        self.beginInsertRows(QModelIndex(), row, row + len(tags) - 1)
+        for (_, key), column in zip(COLUMNS, self.columns):
+            if key is None:
+                column.extend("" for _ in tags)
+            else:
+                column.extend(tag.get(key) or "" for tag in tags)
+        self.endInsertRows()
+
+    def clear(self):
+        '''Removes every row at once'''
+        self.beginResetModel()
+        for column in self.columns:
+            column.clear()
+        self.endResetModel()
+
+    def remove_rows(self, rows):
+        '''Removes rows, given in any order'''
+        for row in sorted(set(rows), reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            for column in self.columns:
+                del column[row]
+            self.endRemoveRows()
+
+    def update_values(self, changes):
+        '''Stores a batch of (row, value) pairs and emits one dataChanged over the rows it touched'''
+        if not changes:
+            return
+        values = self.columns[VALUE_COLUMN]
+        first = last = changes[0][0]
+        for row, value in changes:
+            values[row] = value
+            if row < first:
+                first = row
+            elif row > last:
+                last = row
+        self.dataChanged.emit(self.index(first, VALUE_COLUMN), self.index(last, VALUE_COLUMN), [Qt.DisplayRole])
+
+    def tag(self, row):
+        '''Returns one row as a tag dict, the way it is saved'''
+        return {key: column[row] for (_, key), column in zip(COLUMNS, self.columns)
+                if key is not None and not (key in OPTIONAL_KEYS and column[row] == "")}
+
+    def tags(self):
+        '''Returns the rows as tag dicts, the way they are saved'''
+        return [self.tag(row) for row in range(self.rowCount())]
@@ -0,0 +1,29 @@
+'''Loading tag lists from files, without Qt'''
+import csv
+import json
+import os
+
+
+def load_tags(path):
+    '''Loads a tag list from a tag database (.db), a .json file or a .csv file.
+
+    A .db file is the tag database "Save Tags" writes (see util.tagstore); its
+    active set is loaded. A .json file holds a list of tag dicts.
+    A CSV file needs a header row with the tag keys: ip_address, name, type,
+    area, byte, bit and optionally db_number, deadband, deadband_percent and
+    scan_class.'''
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.db':
+        from util.tagstore import TagStore
+        with TagStore(path) as store:
+            set_id = store.active_set
+            if set_id is None:
+                raise ValueError(f"{path} has no active tag set")
+            return store.load_tags(set_id)
+    if extension == '.json':
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            return [dict(row) for row in csv.DictReader(f)]
+    raise ValueError(f"Unsupported tag file type: {extension}")
@@ -0,0 +1,96 @@
+'''Streaming import of TIA Portal tag exports (.xlsx and .csv)
+
+Rows are read one at a time (openpyxl read-only mode, csv.reader), so
+exports with tens of thousands of tags never have to be in memory at once.'''
+import csv
+import os
+import zipfile
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from util.address import address_fields, parse_address
+from util.tags import compile_tag
+
+# Columns of a TIA Portal "PLC Tags" export that make up a tag
+NAME_COLUMN = "Name"
+TYPE_COLUMN = "Data Type"
+ADDRESS_COLUMN = "Logical Address"
+
+# Where an .xlsx file lists its sheets; reading it is much cheaper than loading the workbook,
+# which parses every shared string
+WORKBOOK_PART = 'xl/workbook.xml'
+SHEET_ELEMENT = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}sheet'
+
+ImportedRow = namedtuple('ImportedRow', 'line values tag compiled error')
+
+
+def sheet_names(path):
+    '''Returns the sheet names of an export; a CSV file has a single sheet named after the file'''
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return [os.path.splitext(os.path.basename(path))[0]]
+
+    try:
+        with zipfile.ZipFile(path) as archive:
+            workbook = ElementTree.fromstring(archive.read(WORKBOOK_PART))
+        return [sheet.get('name') for sheet in workbook.iter(SHEET_ELEMENT)]
+    except (KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+        pass
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def iter_rows(path, sheet_name=None):
+    '''Yields the rows of one sheet as tuples of strings, header row first.
+
+    Empty cells become empty strings. sheet_name defaults to the first sheet
+    and is ignored for CSV files.'''
+    if os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.reader(f):
+                yield tuple(row)
+        return
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        for row in sheet.iter_rows(values_only=True):
+            yield tuple("" if value is None else str(value) for value in row)
+    finally:
+        workbook.close()
+
+
+def is_tag_sheet(header):
+    '''Tells if a header row has the columns needed to build tags'''
+    return all(column in header for column in (NAME_COLUMN, TYPE_COLUMN, ADDRESS_COLUMN))
+
+
+def iter_tags(rows, ip_address=""):
+    '''Turns the rows of a tag sheet into ImportedRows as they arrive.
+
+    Each row comes with its tag dict and CompiledTag, or with the error that
+    kept it from compiling. Raises ValueError if the header lacks a tag column.'''
+    rows = iter(rows)
+    header = next(rows, ())
+    if not is_tag_sheet(header):
+        raise ValueError(f"Tag sheets need the columns {NAME_COLUMN}, {TYPE_COLUMN} and {ADDRESS_COLUMN}")
+    name_index = header.index(NAME_COLUMN)
+    type_index = header.index(TYPE_COLUMN)
+    address_index = header.index(ADDRESS_COLUMN)
+
+    for line, values in enumerate(rows, start=2):
+        try:
+            tag = {
+                "ip_address": ip_address,
+                "name": values[name_index],
+                "type": values[type_index],
+                **address_fields(parse_address(values[address_index])),
+            }
+            yield ImportedRow(line, values, tag, compile_tag(tag), None)
+        except (IndexError, ValueError) as e:
+            yield ImportedRow(line, values, None, None, e)
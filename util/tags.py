@@ -0,0 +1,105 @@
+'''Tags compiled once into immutable objects, so the read loop only slices and decodes'''
+import logging
+
+from snap7.types import Areas
+from util.address import AREAS
+from util.codecs import BOOL_CODECS, get_codec
+
+log = logging.getLogger(__name__)
+
+# Area column values of the tag table. Tags saved by older versions store the
+# address width with the letter (IW, MB, ...), which doesn't change the area.
+AREA_MAPPING = dict(AREAS)
+AREA_MAPPING.update({letter + width: AREAS[letter] for letter in 'IQM' for width in 'XBWD'})
+# Types that decode to plain numbers, the only ones a deadband can measure a change of
+DEADBAND_TYPES = {'BYTE', 'WORD', 'DWORD', 'LWORD', 'SINT', 'INT', 'DINT', 'LINT',
+                  'USINT', 'UINT', 'UDINT', 'ULINT', 'REAL', 'LREAL'}
+
+
+class CompiledTag:
+    '''A tag with its area, offsets, size and decoder resolved ahead of time'''
+
+    __slots__ = ('name', 'type', 'area', 'db_number', 'byte', 'bit', 'size', 'decode', 'encode', 'deadband')
+
+    def __init__(self, name, tag_type, area, db_number, byte, bit, size, decode, encode, deadband=None):
+        set_slot = object.__setattr__
+        set_slot(self, 'name', name)
+        set_slot(self, 'type', tag_type)
+        set_slot(self, 'area', area)
+        set_slot(self, 'db_number', db_number)
+        set_slot(self, 'byte', byte)
+        set_slot(self, 'bit', bit)
+        set_slot(self, 'size', size)
+        set_slot(self, 'decode', decode)
+        set_slot(self, 'encode', encode)
+        # (absolute, fraction of the last value) a change must exceed to be published, or None
+        set_slot(self, 'deadband', deadband)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledTag is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompiledTag is immutable")
+
+    def __repr__(self):
+        return f"<CompiledTag {self.name} {self.type} {self.area} db={self.db_number} byte={self.byte} bit={self.bit}>"
+
+    @property
+    def span(self):
+        '''The (area, db_number, start, size) the read planner works with'''
+        return self.area, self.db_number, self.byte, self.size
+
+
+def compile_tag(tag):
+    '''Compiles a tag dict from the tag table into a CompiledTag.
+
+    Raises ValueError if the area or type of the tag isn't supported, or if a
+    deadband is set on a tag that isn't numeric.'''
+    area = tag['area'] if isinstance(tag['area'], Areas) else AREA_MAPPING.get(tag['area'])
+    if area is None:
+        raise ValueError(f"Unsupported area: {tag['area']}")
+
+    byte = int(tag['byte'])
+    bit = int(tag['bit']) if tag.get('bit') not in (None, '') else None
+    db_number = int(tag.get('db_number') or 0)
+
+    codec = get_codec(tag['type'])
+    if codec.name == 'BOOL':
+        if bit is None or not 0 <= bit <= 7:
+            raise ValueError(f"Bool tag needs a bit between 0 and 7, got {tag.get('bit')!r}")
+        codec = BOOL_CODECS[bit]
+
+    deadband = None
+    if tag.get('deadband') or tag.get('deadband_percent'):
+        if codec.name not in DEADBAND_TYPES:
+            raise ValueError(f"{codec.name} tags can't have a deadband, only numeric ones can")
+        deadband = float(tag.get('deadband') or 0), float(tag.get('deadband_percent') or 0) / 100
+
+    return CompiledTag(
+        tag['name'], codec.name, area, db_number, byte, bit, codec.size, codec.decode, codec.encode, deadband,
+    )
+
+
+def compile_tags(tags):
+    '''Compiles a list of tag dicts, keeping None in place of tags that can't be read'''
+    compiled = []
+    for tag in tags:
+        try:
+            compiled.append(compile_tag(tag))
+        except (KeyError, ValueError) as e:
+            log.warning("Error compiling tag %r: %s", tag.get('name'), e)
+            compiled.append(None)
+    return compiled
+
+
+def changed(tag, value, last):
+    '''Tells if value differs enough from the last published value to be published again'''
+    if tag.deadband is None or value is None or last is None:
+        return value != last
+    absolute, fraction = tag.deadband
+    return abs(value - last) > max(absolute, abs(last) * fraction)
+
+
+def tag_spans(compiled):
+    '''Returns the planner spans of a compiled tag list'''
+    return [tag.span if tag is not None else None for tag in compiled]
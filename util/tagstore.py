@@ -0,0 +1,182 @@
+'''SQLite tag database: named tag sets per PLC, edited one row at a time
+
+Replaces the JSON blob the GUI used to keep in QSettings. Tags are rows
+indexed on PLC/area/offset, so adding, removing or editing a tag touches only
+that row, and startup loads only the active set.'''
+import json
+import os
+import sqlite3
+
+from snap7.types import Areas
+
+from util.address import AREA_LETTERS
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".snap7_tools", "tags.db")
+DEFAULT_SET = "Default"
+
+# Tag keys with their own column; any other key (deadband, ...) goes into the extra JSON
+TAG_COLUMNS = ("ip_address", "name", "type", "area", "db_number", "byte", "bit")
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tag_sets (
+    id INTEGER PRIMARY KEY,
+    ip_address TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (ip_address, name)
+);
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    set_id INTEGER NOT NULL REFERENCES tag_sets (id) ON DELETE CASCADE,
+    ip_address TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    area TEXT NOT NULL,
+    db_number INTEGER NOT NULL,
+    byte INTEGER NOT NULL,
+    bit INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS tags_by_set ON tags (set_id);
+CREATE INDEX IF NOT EXISTS tags_by_location ON tags (ip_address, area, db_number, byte);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def _optional_int(value):
+    return None if value is None or value == "" else int(value)
+
+
+def _row(tag):
+    '''Turns a tag dict into the column values of a tags row, without set_id'''
+    area = tag["area"]
+    if isinstance(area, Areas):
+        area = AREA_LETTERS[area]
+    # Keys left empty (no deadband, no scan class) aren't stored
+    extra = {key: value for key, value in tag.items()
+             if key not in TAG_COLUMNS and key != "id" and value not in (None, "")}
+    return (
+        tag.get("ip_address") or "",
+        tag.get("name") or "",
+        tag["type"],
+        area,
+        _optional_int(tag.get("db_number")) or 0,
+        int(tag["byte"]),
+        _optional_int(tag.get("bit")),
+        json.dumps(extra) if extra else None,
+    )
+
+
+def _tag(row):
+    '''Turns a tags row back into a tag dict, in the form the tag table stores (see address_fields)'''
+    tag_id, ip_address, name, tag_type, area, db_number, byte, bit, extra = row
+    tag = {
+        "id": tag_id,
+        "ip_address": ip_address,
+        "name": name,
+        "type": tag_type,
+        "area": area,
+        "db_number": str(db_number) if db_number else "",
+        "byte": str(byte),
+        "bit": str(bit) if bit is not None else "",
+    }
+    if extra:
+        tag.update(json.loads(extra))
+    return tag
+
+
+class TagStore:
+    '''Tag sets and their tags in a SQLite file. Tag dicts read from the store carry their row "id".'''
+
+    def __init__(self, path=DEFAULT_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Tag sets
+
+    def tag_sets(self, ip_address=None):
+        '''Returns (id, ip_address, name) of every set, or of the sets of one PLC'''
+        if ip_address is None:
+            return self.db.execute("SELECT id, ip_address, name FROM tag_sets ORDER BY ip_address, name").fetchall()
+        return self.db.execute("SELECT id, ip_address, name FROM tag_sets WHERE ip_address = ? ORDER BY name",
+                               (ip_address,)).fetchall()
+
+    def tag_set(self, ip_address, name=DEFAULT_SET):
+        '''Returns the id of a named set of a PLC, creating the set if it doesn't exist'''
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO tag_sets (ip_address, name) VALUES (?, ?)", (ip_address, name))
+        return self.db.execute("SELECT id FROM tag_sets WHERE ip_address = ? AND name = ?",
+                               (ip_address, name)).fetchone()[0]
+
+    def remove_tag_set(self, set_id):
+        '''Removes a set and all of its tags'''
+        with self.db:
+            self.db.execute("DELETE FROM tag_sets WHERE id = ?", (set_id,))
+            self.db.execute("DELETE FROM settings WHERE key = 'active_set' AND value = ?", (str(set_id),))
+
+    @property
+    def active_set(self):
+        '''Id of the set the GUI opens at startup, or None'''
+        row = self.db.execute("SELECT value FROM settings WHERE key = 'active_set'").fetchone()
+        return int(row[0]) if row else None
+
+    @active_set.setter
+    def active_set(self, set_id):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('active_set', ?)", (str(set_id),))
+
+    # Tags
+
+    def load_tags(self, set_id):
+        '''Returns the tags of a set in the order they were added'''
+        rows = self.db.execute(
+            "SELECT id, ip_address, name, type, area, db_number, byte, bit, extra FROM tags WHERE set_id = ? ORDER BY id",
+            (set_id,))
+        return [_tag(row) for row in rows]
+
+    def add_tags(self, set_id, tags):
+        '''Adds tags to a set in one transaction and stores their new row ids in the dicts as "id"'''
+        with self.db:
+            for tag in tags:
+                cursor = self.db.execute(
+                    "INSERT INTO tags (set_id, ip_address, name, type, area, db_number, byte, bit, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (set_id,) + _row(tag))
+                tag["id"] = cursor.lastrowid
+        return tags
+
+    def update_tags(self, tags):
+        '''Writes back edited tags, matched by their "id"'''
+        with self.db:
+            self.db.executemany(
+                "UPDATE tags SET ip_address = ?, name = ?, type = ?, area = ?, db_number = ?, byte = ?, bit = ?, extra = ? "
+                "WHERE id = ?", [_row(tag) + (tag["id"],) for tag in tags])
+
+    def remove_tags(self, tag_ids):
+        with self.db:
+            self.db.executemany("DELETE FROM tags WHERE id = ?", [(tag_id,) for tag_id in tag_ids])
+
+    def tags_at(self, ip_address, area, db_number=0, start=0, end=None):
+        '''Returns the tags of a PLC whose byte offset is in [start, end) of one area, from every set'''
+        if isinstance(area, Areas):
+            area = AREA_LETTERS[area]
+        end = 1 << 31 if end is None else end
+        rows = self.db.execute(
+            "SELECT id, ip_address, name, type, area, db_number, byte, bit, extra FROM tags "
+            "WHERE ip_address = ? AND area = ? AND db_number = ? AND byte >= ? AND byte < ? ORDER BY byte, bit",
+            (ip_address, area, db_number, start, end))
+        return [_tag(row) for row in rows]
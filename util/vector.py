@@ -0,0 +1,79 @@
+'''Vectorized NumPy decoding of whole read blocks into columnar arrays'''
+import numpy as np
+
+# Big-endian NumPy dtype of every tag type that decodes to a plain number
+TAG_DTYPES = {
+    'BYTE': 'u1',
+    'WORD': '>u2',
+    'DWORD': '>u4',
+    'LWORD': '>u8',
+    'SINT': 'i1',
+    'INT': '>i2',
+    'DINT': '>i4',
+    'LINT': '>i8',
+    'USINT': 'u1',
+    'UINT': '>u2',
+    'UDINT': '>u4',
+    'ULINT': '>u8',
+    'REAL': '>f4',
+    'LREAL': '>f8',
+}
+
+
+class BlockLayout:
+    '''The tags of one read block grouped by type, with their gather indices precomputed'''
+
+    def __init__(self, block, compiled):
+        groups = {}
+        for index, offset in block.members:
+            groups.setdefault(compiled[index].type, []).append((index, offset))
+
+        self.numbers = []   # (tag type, tag indices, gather indices, dtype)
+        self.bools = None   # (tag indices, byte offsets, bit numbers)
+        self.scalars = []   # (tag index, offset, decode) for types NumPy can't decode
+        for tag_type, members in groups.items():
+            indices = np.array([index for index, _ in members], dtype=np.intp)
+            offsets = np.array([offset for _, offset in members], dtype=np.intp)
+            if tag_type == 'BOOL':
+                bits = np.array([compiled[index].bit for index, _ in members], dtype=np.uint8)
+                self.bools = indices, offsets, bits
+            elif tag_type in TAG_DTYPES:
+                dtype = np.dtype(TAG_DTYPES[tag_type])
+                gather = offsets[:, None] + np.arange(dtype.itemsize)
+                self.numbers.append((tag_type, indices, gather, dtype))
+            else:
+                self.scalars.extend((index, offset, compiled[index].decode) for index, offset in members)
+
+    def decode(self, data):
+        '''Decodes a block buffer into {tag type: (tag indices, values array)}'''
+        raw = np.frombuffer(data, dtype=np.uint8)
+        columns = {}
+        for tag_type, indices, gather, dtype in self.numbers:
+            # Gathering gives a contiguous (tags, itemsize) byte matrix that views as one value per row
+            columns[tag_type] = indices, raw[gather].view(dtype).ravel()
+        if self.bools is not None:
+            indices, offsets, bits = self.bools
+            columns['BOOL'] = indices, (raw[offsets] >> bits & 1).astype(bool)
+        return columns
+
+    def decode_into(self, data, values):
+        '''Decodes a block buffer and stores each value at its tag index in values'''
+        for indices, array in self.decode(data).values():
+            for index, value in zip(indices.tolist(), array.tolist()):
+                values[index] = value
+        for index, offset, decode in self.scalars:
+            values[index] = decode(data, offset)
+
+
+class VectorDecoder:
+    '''Decodes planned read blocks with one NumPy operation per tag type and block'''
+
+    def __init__(self, compiled, requests):
+        self.layouts = {}
+        for request in requests:
+            for block in request:
+                self.layouts[block] = BlockLayout(block, compiled)
+
+    def decode_into(self, block, data, values):
+        '''Stores the values of every tag of block in values, indexed like the tag list'''
+        self.layouts[block].decode_into(data, values)
@@ -0,0 +1,201 @@
+'''Batched tag writes: queued writes are merged into as few S7 requests as possible
+
+Values are encoded into the bytes they cover. Adjacent bytes of one area/DB
+are merged into a single block, and the blocks are packed into
+write_multi_vars requests. BOOL writes only change their bit: every byte that
+only has bit writes is read right before the write, all of its bits are
+applied at once and the whole byte is written back.'''
+import ctypes
+import struct
+import threading
+
+from snap7.types import Areas, S7DataItem, WordLen
+
+from util.planner import DEFAULT_PDU_LENGTH, pack_multi_vars, plan_reads, read_request
+
+# Bytes of a write request PDU that are taken up by headers instead of data
+WRITE_PDU_OVERHEAD = 35
+# Bytes of a write_multi_vars request taken up by the header, and by each item
+MULTI_VAR_WRITE_OVERHEAD = 19
+MULTI_VAR_WRITE_ITEM_OVERHEAD = 16
+
+INTEGER_TYPES = {'BYTE', 'WORD', 'DWORD', 'LWORD', 'SINT', 'INT', 'DINT', 'LINT',
+                 'USINT', 'UINT', 'UDINT', 'ULINT', 'TIME', 'LTIME'}
+TRUE_TEXTS = {'1', 'true', 'on', 'yes'}
+FALSE_TEXTS = {'0', 'false', 'off', 'no'}
+
+
+class WriteBlock:
+    '''Contiguous bytes of one area/DB that are written with a single request'''
+
+    def __init__(self, area, db_number, start, data):
+        self.area = area
+        self.db_number = db_number
+        self.start = start
+        self.data = data
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"<WriteBlock {self.area} db={self.db_number} start={self.start} size={self.size}>"
+
+
+def max_write_size(pdu_length=DEFAULT_PDU_LENGTH):
+    '''Returns the largest payload that fits in one write request'''
+    return pdu_length - WRITE_PDU_OVERHEAD
+
+
+def multi_var_write_size(block):
+    '''Returns the bytes a block takes up in a write_multi_vars request'''
+    return MULTI_VAR_WRITE_ITEM_OVERHEAD + block.size + (block.size & 1)
+
+
+def parse_value(tag, text):
+    '''Converts text typed by a user into a value for a compiled tag. Raises ValueError.'''
+    text = text.strip()
+    if tag.type == 'BOOL':
+        if text.lower() in TRUE_TEXTS:
+            return True
+        if text.lower() in FALSE_TEXTS:
+            return False
+        raise ValueError(f"{text!r} is not a Bool value, use 1/0 or true/false")
+    if tag.type in INTEGER_TYPES:
+        return int(text, 0)
+    if tag.type in ('REAL', 'LREAL'):
+        return float(text)
+    if tag.type in ('CHAR', 'WCHAR') or tag.type.startswith(('STRING', 'WSTRING')):
+        return text
+    raise ValueError(f"{tag.type} values can't be entered as text")
+
+
+def plan_writes(byte_values, pdu_length=DEFAULT_PDU_LENGTH):
+    '''Merges {(area, db_number): {offset: byte}} into write blocks packed into requests'''
+    max_size = max_write_size(pdu_length)
+    blocks = []
+    for (area, db_number), values in byte_values.items():
+        block = None
+        for offset in sorted(values):
+            if block is None or offset != block.start + block.size or block.size >= max_size:
+                block = WriteBlock(area, db_number, offset, bytearray())
+                blocks.append(block)
+            block.data.append(values[offset])
+    return pack_multi_vars(blocks, pdu_length, MULTI_VAR_WRITE_OVERHEAD, multi_var_write_size)
+
+
+def write_multi_vars(plc, blocks):
+    '''Writes several blocks with one write_multi_vars call'''
+    items = (S7DataItem * len(blocks))()
+    buffers = []
+    for item, block in zip(items, blocks):
+        buffer = (ctypes.c_uint8 * block.size).from_buffer_copy(block.data)
+        item.WordLen = WordLen.Byte.value
+        item.Area = block.area.value
+        item.DBNumber = block.db_number
+        item.Start = block.start
+        item.Amount = block.size
+        item.pData = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint8))
+        buffers.append(buffer)
+    plc.write_multi_vars(items)
+
+
+def write_request(plc, request):
+    '''Writes one planned request'''
+    if len(request) == 1:
+        block = request[0]
+        plc.write_area(block.area, block.db_number, block.start, block.data)
+    else:
+        write_multi_vars(plc, request)
+
+
+class WriteQueue:
+    '''Writes queued for one PLC. put() may be called from any thread; flush() applies them all.
+
+    A later write to the same bytes or bit replaces an earlier one.'''
+
+    def __init__(self, pdu_length=None):
+        # None plans every flush for the PDU length the client negotiated
+        self.pdu_length = pdu_length
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # (area, db_number) -> {offset: byte value}
+        self.bytes = {}
+        # (area, db_number) -> {offset: [mask of bits to set, mask of bits to clear]}, for bytes only written bitwise
+        self.bits = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def put(self, tag, value):
+        '''Queues a write of value to a compiled tag. Raises ValueError if the value doesn't fit the tag.'''
+        if tag is None:
+            raise ValueError("Tags that don't compile can't be written")
+        if tag.area in (Areas.TM, Areas.CT):
+            raise ValueError(f"{tag.name}: timers and counters can't be written")
+        key = (tag.area, tag.db_number)
+
+        if tag.type == 'BOOL':
+            mask = 1 << tag.bit
+            with self.lock:
+                values = self.bytes.get(key)
+                if values is not None and tag.byte in values:
+                    # The whole byte is written anyway, so the bit goes straight into it
+                    values[tag.byte] = values[tag.byte] | mask if value else values[tag.byte] & ~mask
+                else:
+                    masks = self.bits.setdefault(key, {}).setdefault(tag.byte, [0, 0])
+                    masks[0 if value else 1] |= mask
+                    masks[1 if value else 0] &= ~mask
+                self.count += 1
+            return
+
+        data = bytearray(tag.size)
+        try:
+            tag.encode(data, 0, value)
+        except (struct.error, TypeError, UnicodeEncodeError, OverflowError) as e:
+            raise ValueError(f"{tag.name}: {value!r} doesn't fit a {tag.type}: {e}") from e
+        with self.lock:
+            values = self.bytes.setdefault(key, {})
+            bits = self.bits.get(key, {})
+            for offset, byte in enumerate(data, start=tag.byte):
+                values[offset] = byte
+                bits.pop(offset, None)
+            self.count += 1
+
+    def take(self):
+        '''Returns and forgets the queued (bytes, bits, count)'''
+        with self.lock:
+            queued = self.bytes, self.bits, self.count
+            self.clear()
+        return queued
+
+    def flush(self, plc):
+        '''Applies every queued write and returns the number of requests it took.
+
+        Writes that fail are not retried: a value forced a while ago may no longer be wanted.'''
+        byte_values, bits, count = self.take()
+        if not count:
+            return 0
+        pdu_length = self.pdu_length or plc.get_pdu_length()
+        requests = 0
+
+        # Read-modify-write of the bytes that only have bit writes, all in one planned read
+        keys = [(key, offset) for key, masks in bits.items() for offset in masks]
+        if keys:
+            spans = [(area, db_number, offset, 1) for (area, db_number), offset in keys]
+            read_plan = plan_reads(spans, pdu_length=pdu_length)
+            for request in read_plan:
+                for block, data in zip(request, read_request(plc, request)):
+                    for i, offset in block.members:
+                        key, byte = keys[i]
+                        set_mask, clear_mask = bits[key][byte]
+                        byte_values.setdefault(key, {})[byte] = (data[offset] | set_mask) & ~clear_mask & 0xFF
+            requests += len(read_plan)
+
+        write_plan = plan_writes(byte_values, pdu_length)
+        for request in write_plan:
+            write_request(plc, request)
+        return requests + len(write_plan)